@@ -1,4 +1,3 @@
-import asyncio
 import logging
 from typing import List
 
@@ -15,12 +14,15 @@ from aioconsole import ainput
 from starknet_py.hash.utils import message_signature
 from starknet_py.net.full_node_client import FullNodeClient
 
+from order_book import OrderBookManager
+from runtime import runtime
+
 
 class CustomCLIClient(CLIClient):
 
     async def start(self, domain):
 
-        node_client = FullNodeClient(node_url=self.cli_cfg.node)
+        node_client = FullNodeClient(node_url=self.cli_cfg.node, session=runtime.session())
         erc_to_addr = {token.symbol: token.address for token in self.cli_cfg.tokens}
         contract_client = AkiraExchangeClient(node_client,
                                               self.cli_cfg.core_address,
@@ -47,21 +49,32 @@ class CustomCLIClient(CLIClient):
                                                verbose=self.cli_cfg.verbose)
 
         await self.exchange_client.init()
+        runtime.close_on_shutdown(api_client)
 
         async def sub_consumer(d):
             logging.info(f'Subscription emitted {d}')
 
+        self.books = OrderBookManager(verbose=self.cli_cfg.verbose)
+
         async def handle_websocket_req(command: str, args: List[str]):
             if command == 'start_ws':
-                asyncio.create_task(ws.run_stream_listener(ContractAddress(args[0]), True))
+                runtime.spawn(ws.run_stream_listener(ContractAddress(args[0]), True))
                 return True
             elif command == 'subscribe_fills':
                 print(await ws.subscribe_fills(ContractAddress(args[0]), sub_consumer))
                 return True
             elif command == 'subscribe_book':
+                consumer = sub_consumer
+                if args[0] == 'snap':
+                    consumer = self.books.consumer(args[1], args[2])
                 print(await ws.subscribe_book(Stream(args[0]), TradedPair(ERC20Token(args[1]), ERC20Token(args[2])),
                                               bool(int(args[3])),
-                                              sub_consumer))
+                                              consumer))
+                return True
+            elif command == 'book':
+                book = self.books.get(args[0], args[1])
+                depth = int(args[2]) if len(args) > 2 else 10
+                print(book.depth(depth) if book else f'No synced book for {args[0]}/{args[1]}')
                 return True
             return False
 
@@ -69,6 +82,7 @@ class CustomCLIClient(CLIClient):
             return (await self.exchange_client.query_listen_key(signer)).data
 
         ws = WsClient(self._erc_to_decimals, issue_listen_key, self.cli_cfg.wss, verbose=self.cli_cfg.verbose)
+        runtime.close_on_shutdown(ws)
         trading_account = self.cli_cfg.trading_account[0]
         presets_commands = [
             ['set_account', self.cli_cfg.trading_account],
@@ -0,0 +1,141 @@
+import csv
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, Optional
+
+
+class AccountRecord:
+    """One trading account of a fleet. Holds no private key, only where to find it (key_ref)."""
+    __slots__ = ('address', 'public_key', 'key_ref')
+
+    def __init__(self, address: str, public_key: str, key_ref: Optional[str] = None):
+        self.address = address
+        self.public_key = public_key
+        self.key_ref = key_ref
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> 'AccountRecord':
+        return cls(d['account_address'], d['public_key'], d.get('key_ref') or None)
+
+    def to_dict(self) -> Dict:
+        d = {'account_address': self.address, 'public_key': self.public_key}
+        if self.key_ref:
+            d['key_ref'] = self.key_ref
+        return d
+
+    def __repr__(self):
+        return f'AccountRecord({self.address})'
+
+
+class AccountSource(ABC):
+    """Lazily yields AccountRecords, one at a time, so a fleet is never loaded into memory at once"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[AccountRecord]:
+        ...
+
+
+class CsvAccountSource(AccountSource):
+    """CSV with a header: account_address,public_key[,key_ref]"""
+
+    def __iter__(self):
+        with open(self.path, newline='') as f:
+            for row in csv.DictReader(f):
+                yield AccountRecord.from_dict(row)
+
+
+class JsonlAccountSource(AccountSource):
+    """One JSON object per line: {"account_address": ..., "public_key": ..., "key_ref": ...}"""
+
+    def __iter__(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    yield AccountRecord.from_dict(json.loads(line))
+
+
+class SqliteAccountSource(AccountSource):
+    """Rows of (account_address, public_key, key_ref) from a table, read in batches"""
+
+    def __init__(self, path: str, table: str = 'accounts', batch: int = 1000):
+        super().__init__(path)
+        self.table = table
+        self.batch = batch
+
+    def __iter__(self):
+        db = sqlite3.connect(self.path)
+        try:
+            columns = {row[1] for row in db.execute(f'PRAGMA table_info({self.table})')}
+            key_ref = 'key_ref' if 'key_ref' in columns else 'NULL'
+            cur = db.execute(f'SELECT account_address, public_key, {key_ref} FROM {self.table}')
+            while rows := cur.fetchmany(self.batch):
+                for address, public_key, ref in rows:
+                    yield AccountRecord(address, public_key, ref)
+        finally:
+            db.close()
+
+
+def open_account_source(path: str) -> AccountSource:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return CsvAccountSource(path)
+    if ext in ('.jsonl', '.ndjson'):
+        return JsonlAccountSource(path)
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        return SqliteAccountSource(path)
+    raise Exception(f'Unsupported account source {path}, expected .csv, .jsonl or .sqlite')
+
+
+class KeyBackend(ABC):
+    """Resolves the private key of one account right before it is used"""
+
+    @abstractmethod
+    def private_key(self, account: AccountRecord) -> str:
+        ...
+
+
+class EnvKeyBackend(KeyBackend):
+    """Key from the environment variable named by key_ref, or <prefix><account_address>"""
+
+    def __init__(self, prefix: str = 'AKIRA_PK_'):
+        self.prefix = prefix
+
+    def private_key(self, account: AccountRecord) -> str:
+        name = account.key_ref or f'{self.prefix}{account.address}'
+        key = os.environ.get(name)
+        if not key:
+            raise Exception(f'No private key for {account.address} (set {name})')
+        return key
+
+
+class KeystoreKeyBackend(KeyBackend):
+    """Key from an Ethereum-format keystore file <directory>/<key_ref or account_address.json>"""
+
+    def __init__(self, directory: str, password: Optional[str] = None):
+        self.directory = directory
+        self.password = password if password is not None else os.environ.get('AKIRA_KEYSTORE_PASSWORD', '')
+
+    def private_key(self, account: AccountRecord) -> str:
+        from starknet_py.net.signer.key_pair import KeyPair
+
+        path = os.path.join(self.directory, account.key_ref or f'{account.address}.json')
+        # eth_keyfile derives the key from the password bytes, a str fails in pbkdf2_hmac
+        return hex(KeyPair.from_keystore(path, self.password.encode()).private_key)
+
+
+def trading_account(account: AccountRecord, keys: KeyBackend):
+    """The (address, public key, private key) tuple scripts expect in cli_cfg.trading_account"""
+    from LayerAkira.src.common.ContractAddress import ContractAddress
+
+    return ContractAddress(account.address), ContractAddress(account.public_key), keys.private_key(account)
+
+
+def key_backend(name: str, keystore_dir: Optional[str] = None) -> KeyBackend:
+    if name == 'keystore':
+        return KeystoreKeyBackend(keystore_dir or 'keystore')
+    return EnvKeyBackend()
@@ -0,0 +1,279 @@
+import argparse
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from portfolio_valuation import FREE, LOCKED, ONCHAIN, PortfolioValuation
+
+COLUMNS = {
+    'account': np.uint32,
+    'token': np.uint16,
+    'balance': np.float64,
+    'locked': np.float64,
+    'onchain': np.float64,
+    'nonce': np.int64,
+}
+# one row per snapshot: (start_row, end_row, timestamp, start/end of its accounts in covered.bin)
+INDEX_DTYPE = np.dtype([('start', np.int64), ('end', np.int64), ('ts', np.int64),
+                        ('cov_start', np.int64), ('cov_end', np.int64)])
+COVERED_DTYPE = np.uint32  # covered.bin, with each account's nonce at the same position in covered_nonce.bin
+NONCE_DTYPE = np.int64
+
+Row = Tuple[str, str, float, float, float, int]  # account, token, balance, locked, onchain, nonce
+
+
+class BalanceHistory:
+    """Append-only columnar store of balance snapshots.
+
+    Every column is a flat binary file read back through np.memmap; accounts and tokens are
+    interned into small text dictionaries so rows stay fixed-size. Only non-zero (account, token)
+    rows are stored, a missing row means zero for an account the snapshot covered; accounts a
+    snapshot did not check are recorded as not covered rather than as drained. The snapshot index
+    is written last, so a run interrupted mid-append leaves no half-written snapshot behind."""
+
+    def __init__(self, path: str = 'balance_history'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.accounts = self._load_dict('accounts.txt')
+        self.tokens = self._load_dict('tokens.txt')
+        self._account_code = {a: i for i, a in enumerate(self.accounts)}
+        self._token_code = {t: i for i, t in enumerate(self.tokens)}
+        self._truncate_to_index()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_dict(self, name) -> List[str]:
+        if not os.path.exists(self._file(name)):
+            return []
+        with open(self._file(name)) as f:
+            return f.read().splitlines()
+
+    def _map(self, name, dtype) -> np.ndarray:
+        file = self._file(name)
+        if not os.path.exists(file) or os.path.getsize(file) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file, dtype=dtype, mode='r')
+
+    def _truncate_to_index(self):
+        index = self.index()
+        rows = int(index['end'][-1]) if len(index) else 0
+        covered = int(index['cov_end'][-1]) if len(index) else 0
+        sizes = [(f'{name}.bin', rows * np.dtype(dtype).itemsize) for name, dtype in COLUMNS.items()]
+        sizes += [('covered.bin', covered * np.dtype(COVERED_DTYPE).itemsize),
+                  ('covered_nonce.bin', covered * np.dtype(NONCE_DTYPE).itemsize)]
+        for name, size in sizes:
+            file = self._file(name)
+            if os.path.exists(file) and os.path.getsize(file) > size:
+                os.truncate(file, size)
+
+    def _intern(self, value: str, codes: Dict[str, int], values: List[str], name: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+            with open(self._file(name), 'a') as f:
+                f.write(value + '\n')
+        return code
+
+    def index(self) -> np.ndarray:
+        return self._map('snapshots.bin', INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index())
+
+    def _account(self, account) -> int:
+        return self._intern(str(account), self._account_code, self.accounts, 'accounts.txt')
+
+    def append(self, rows: Iterable[Row], ts: Optional[int] = None, accounts: Iterable[str] = (),
+               nonces: Optional[Dict[str, int]] = None) -> int:
+        """Appends one snapshot and returns its number. The snapshot covers the given accounts
+        plus every account that appears in rows, zero rows included. Nonces are kept per covered
+        account, from nonces or else from its rows, so accounts without funds keep theirs too."""
+        cols = {name: [] for name in COLUMNS}
+        covered = {self._account(account): 0 for account in accounts}
+        for account, nonce in (nonces or {}).items():
+            covered[self._account(account)] = int(nonce)
+        for account, token, balance, locked, onchain, nonce in rows:
+            code = self._account(account)
+            if nonces is None or str(account) not in nonces:
+                covered[code] = max(covered.get(code, 0), int(nonce))
+            if not (balance or locked or onchain):
+                continue
+            cols['account'].append(self._account(account))
+            cols['token'].append(self._intern(str(token), self._token_code, self.tokens, 'tokens.txt'))
+            cols['balance'].append(balance)
+            cols['locked'].append(locked)
+            cols['onchain'].append(onchain)
+            cols['nonce'].append(nonce)
+        index = self.index()
+        start = int(index['end'][-1]) if len(index) else 0
+        cov_start = int(index['cov_end'][-1]) if len(index) else 0
+        for name, dtype in COLUMNS.items():
+            with open(self._file(f'{name}.bin'), 'ab') as f:
+                np.asarray(cols[name], dtype=dtype).tofile(f)
+        codes = sorted(covered)
+        with open(self._file('covered.bin'), 'ab') as f:
+            np.asarray(codes, dtype=COVERED_DTYPE).tofile(f)
+        with open(self._file('covered_nonce.bin'), 'ab') as f:
+            np.asarray([covered[c] for c in codes], dtype=NONCE_DTYPE).tofile(f)
+        entry = np.array([(start, start + len(cols['account']), int(ts if ts is not None else time.time()),
+                           cov_start, cov_start + len(covered))], dtype=INDEX_DTYPE)
+        with open(self._file('snapshots.bin'), 'ab') as f:
+            entry.tofile(f)
+        return len(index)
+
+    def append_valuation(self, valuation: PortfolioValuation, nonces: Dict[str, int] = None,
+                         ts: Optional[int] = None) -> int:
+        data = valuation._data[:len(valuation)]
+        acc_idx, tok_idx = np.nonzero(data.any(axis=2))
+        nonces = nonces or {}
+        return self.append(((valuation.accounts[a], valuation.tokens[t], data[a, t, FREE], data[a, t, LOCKED],
+                             data[a, t, ONCHAIN], nonces.get(valuation.accounts[a], 0))
+                            for a, t in zip(acc_idx, tok_idx)), ts, valuation.accounts, nonces)
+
+    def snapshot(self, n: int = -1) -> Dict[str, np.ndarray]:
+        """Column views of snapshot n (negative counts from the latest)"""
+        start, end = self.index()[n][['start', 'end']]
+        return {name: self._map(f'{name}.bin', dtype)[start:end] for name, dtype in COLUMNS.items()}
+
+    def coverage(self, n: int = -1) -> np.ndarray:
+        """Sorted codes of the accounts snapshot n checked"""
+        start, end = self.index()[n][['cov_start', 'cov_end']]
+        return self._map('covered.bin', COVERED_DTYPE)[start:end]
+
+    def nonces(self, n: int = -1) -> np.ndarray:
+        """Nonce of every account in coverage(n), same order"""
+        start, end = self.index()[n][['cov_start', 'cov_end']]
+        return self._map('covered_nonce.bin', NONCE_DTYPE)[start:end]
+
+    def _latest_nonces(self, accounts: np.ndarray, upto: int) -> Dict[int, int]:
+        found: Dict[int, int] = {}
+        for n in range(upto - 1, -1, -1):
+            if len(found) == len(accounts):
+                break
+            for code, nonce in zip(self.coverage(n).tolist(), self.nonces(n).tolist()):
+                if code not in found and code in accounts:
+                    found[code] = nonce
+        return found
+
+    def nonce_diff(self, before: Optional[int] = None, after: int = -1) -> List[Tuple[str, int, int]]:
+        """(account, nonce before, nonce after) for accounts whose nonce changed, compared like diff()"""
+        after = after % len(self)
+        now = dict(zip(self.coverage(after).tolist(), self.nonces(after).tolist()))
+        if before is None:
+            was = self._latest_nonces(set(now), after)
+        else:
+            was = dict(zip(self.coverage(before).tolist(), self.nonces(before).tolist()))
+        return [(self.accounts[code], was[code], nonce) for code, nonce in sorted(now.items())
+                if code in was and was[code] != nonce]
+
+    @staticmethod
+    def _select(snap, accounts: np.ndarray) -> Dict[str, np.ndarray]:
+        mask = np.isin(snap['account'], accounts)
+        return {name: col[mask] for name, col in snap.items()}
+
+    def _latest(self, accounts: np.ndarray, upto: int) -> Dict[str, np.ndarray]:
+        """Rows of each account from the most recent snapshot before upto that covered it"""
+        parts, remaining = [], np.asarray(accounts)
+        for n in range(upto - 1, -1, -1):
+            if not len(remaining):
+                break
+            found = np.intersect1d(remaining, self.coverage(n))
+            if len(found):
+                parts.append(self._select(self.snapshot(n), found))
+                remaining = np.setdiff1d(remaining, found)
+        if not parts:
+            return {name: np.zeros(0, dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+    @staticmethod
+    def _keys(snap) -> np.ndarray:
+        return (snap['account'].astype(np.int64) << 16) | snap['token'].astype(np.int64)
+
+    def diff(self, before: Optional[int] = None, after: int = -1) -> List[Tuple[str, str, Tuple, Tuple]]:
+        """(account, token, (balance, locked, onchain) before, ... after) for every changed row.
+
+        Only accounts covered by both snapshots are compared. Without before, every account of
+        snapshot after is compared with the latest earlier snapshot that covered it."""
+        after = after % len(self)
+        if before is None:
+            accounts = np.asarray(self.coverage(after))
+            a = self._latest(accounts, after)
+        else:
+            accounts = np.intersect1d(self.coverage(before), self.coverage(after))
+            a = self._select(self.snapshot(before), accounts)
+        b = self._select(self.snapshot(after), accounts)
+        ka, kb = self._keys(a), self._keys(b)
+        keys = np.union1d(ka, kb)
+
+        def aligned(snap, k):
+            out = np.zeros((len(keys), 3))
+            pos = np.searchsorted(keys, k)
+            out[pos] = np.column_stack([snap['balance'], snap['locked'], snap['onchain']])
+            return out
+
+        va, vb = aligned(a, ka), aligned(b, kb)
+        changed = np.flatnonzero((va != vb).any(axis=1))
+        return [(self.accounts[keys[i] >> 16], self.tokens[keys[i] & 0xFFFF],
+                 tuple(va[i].tolist()), tuple(vb[i].tolist())) for i in changed]
+
+    def changed_accounts(self, before: Optional[int] = None, after: int = -1) -> List[str]:
+        changed = {account for account, *_ in self.diff(before, after)}
+        return sorted(changed | {account for account, *_ in self.nonce_diff(before, after)})
+
+    def holders(self, n: Optional[int] = None, min_amount: float = 0.0, token: Optional[str] = None) -> List[str]:
+        """Accounts that still hold more than min_amount of any (or the given) token, in snapshot n
+        or, by default, in the latest snapshot that covered each account"""
+        if n is None:
+            snap = self._latest(np.arange(len(self.accounts)), len(self))
+        else:
+            snap = self.snapshot(n)
+        mask = (snap['balance'] + snap['locked'] + snap['onchain']) > min_amount
+        if token is not None:
+            if token not in self._token_code:
+                return []
+            mask &= snap['token'] == self._token_code[token]
+        return [self.accounts[a] for a in np.unique(snap['account'][mask])]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='BalanceHistory', description='Query balance snapshots')
+    parser.add_argument('--history_dir', default='balance_history')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='list snapshots')
+    diff = sub.add_parser('diff', help='rows changed between two snapshots '
+                                       '(default: accounts of the last snapshot vs their previous check)')
+    diff.add_argument('--before', type=int)
+    diff.add_argument('--after', type=int, default=-1)
+    diff.add_argument('--accounts_only', action='store_true')
+    holders = sub.add_parser('holders', help='accounts still holding funds')
+    holders.add_argument('--snapshot', type=int, help='default: latest check of every account')
+    holders.add_argument('--min_amount', type=float, default=0.0)
+    holders.add_argument('--token')
+    args = parser.parse_args()
+
+    history = BalanceHistory(args.history_dir)
+    if not len(history):
+        print("No snapshots recorded yet")
+        return
+    if args.command == 'list':
+        for i, (start, end, ts, cov_start, cov_end) in enumerate(history.index()):
+            print(f"#{i} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))} rows: {end - start} "
+                  f"accounts: {cov_end - cov_start}")
+    elif args.command == 'diff':
+        if args.accounts_only:
+            print('\n'.join(history.changed_accounts(args.before, args.after)))
+        else:
+            for account, token, was, now in history.diff(args.before, args.after):
+                print(f"{account} {token}: {was} -> {now}")
+            for account, was, now in history.nonce_diff(args.before, args.after):
+                print(f"{account} nonce: {was} -> {now}")
+    elif args.command == 'holders':
+        print('\n'.join(history.holders(args.snapshot, args.min_amount, args.token)))
+
+
+if __name__ == "__main__":
+    main()
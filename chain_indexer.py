@@ -0,0 +1,219 @@
+import argparse
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starknet_py.hash.selector import get_selector_from_name
+from starknet_py.net.full_node_client import FullNodeClient
+
+from rpc_batch import address_int
+from runtime import run, runtime
+
+# Field positions of the LayerAkira core events we index, counted over keys[1:] + data
+# (selector stripped). Amounts are u256 and take two felts (low, high).
+EVENTS = {
+    'Deposit': {'account': 0, 'token': 1, 'amount': 3},  # receiver, token, funder, amount
+    'ReqOnChainWithdrawal': {'account': 0, 'token': 2, 'amount': 3},  # maker, Withdraw{maker, token, amount, ...}
+    'Withdrawal': {'account': 0, 'token': 1, 'amount': 2},  # maker, token, amount, key, ...
+    'NewBinding': {'account': 0, 'signer': 1},  # trading_account, signer
+}
+
+EVENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS events (
+    tx_hash TEXT NOT NULL, event_idx INTEGER NOT NULL, block INTEGER NOT NULL, contract TEXT NOT NULL,
+    name TEXT NOT NULL, account TEXT, token TEXT, amount TEXT,
+    PRIMARY KEY (tx_hash, contract, event_idx)
+)"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (contract TEXT PRIMARY KEY, block INTEGER NOT NULL);
+""" + EVENTS_TABLE + """;
+CREATE TABLE IF NOT EXISTS signers (account TEXT PRIMARY KEY, signer TEXT NOT NULL, block INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS balances (
+    account TEXT NOT NULL, token TEXT NOT NULL,
+    deposited TEXT NOT NULL DEFAULT '0', withdrawn TEXT NOT NULL DEFAULT '0', pending TEXT NOT NULL DEFAULT '0',
+    PRIMARY KEY (account, token)
+);
+CREATE INDEX IF NOT EXISTS events_account ON events (account);
+"""
+
+
+def _hex(felt: int) -> str:
+    return hex(felt)
+
+
+class ChainIndexer:
+    """Incrementally indexes deposit / withdrawal / binding events of the LayerAkira contracts
+    into SQLite, so a sweep can pick accounts that need work without per-account RPC reads.
+
+    Balances derived here only follow deposits and withdrawals (trades settled by the executor
+    move funds without these events), so holders() is a candidate list, not a ledger."""
+
+    def __init__(self, node_client: FullNodeClient, contracts: Iterable[int], db_path: str = 'chain_index.sqlite',
+                 start_block: int = 0, confirmations: int = 2, block_range: int = 5000, chunk_size: int = 1000,
+                 verbose=False):
+        self.node_client = node_client
+        self.contracts = [int(c) for c in contracts]
+        self.db = sqlite3.connect(db_path)
+        self._migrate()
+        self.db.executescript(SCHEMA)
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.block_range = block_range
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self._selectors: Dict[int, str] = {get_selector_from_name(name): name for name in EVENTS}
+
+    def close(self):
+        self.db.close()
+
+    def _migrate(self):
+        # event_idx is counted per contract, older databases keyed events without the contract
+        pk = [row[1] for row in self.db.execute('PRAGMA table_info(events)') if row[5]]
+        if pk and 'contract' not in pk:
+            with self.db:  # one transaction, executescript would commit halfway
+                self.db.execute('ALTER TABLE events RENAME TO events_old')
+                self.db.execute(EVENTS_TABLE)
+                self.db.execute('INSERT INTO events SELECT * FROM events_old')
+                self.db.execute('DROP TABLE events_old')
+
+    def checkpoint(self, contract: int) -> int:
+        row = self.db.execute('SELECT block FROM checkpoint WHERE contract = ?', (_hex(contract),)).fetchone()
+        return row[0] if row else self.start_block - 1
+
+    async def sync(self) -> int:
+        """Reads new events up to the latest confirmed block, returns number of indexed events"""
+        head = await self.node_client.get_block_number() - self.confirmations
+        total = 0
+        for contract in self.contracts:
+            block = self.checkpoint(contract) + 1
+            while block <= head:
+                to_block = min(block + self.block_range - 1, head)
+                events = await self._fetch(contract, block, to_block)
+                with self.db:
+                    total += self._apply(contract, events)
+                    self.db.execute('INSERT OR REPLACE INTO checkpoint VALUES (?, ?)', (_hex(contract), to_block))
+                if self.verbose:
+                    logging.info(f'Indexed {_hex(contract)} blocks {block}..{to_block}: {len(events)} events')
+                block = to_block + 1
+        return total
+
+    async def _fetch(self, contract: int, from_block: int, to_block: int):
+        events, token = [], None
+        keys = [list(self._selectors)]
+        while True:
+            chunk = await self.node_client.get_events(address=contract, keys=keys, from_block_number=from_block,
+                                                      to_block_number=to_block, continuation_token=token,
+                                                      chunk_size=self.chunk_size)
+            events.extend(chunk.events)
+            token = chunk.continuation_token
+            if token is None:
+                return events
+
+    def _apply(self, contract: int, events) -> int:
+        applied = 0
+        per_tx: Dict[int, int] = {}  # position among this contract's events in the tx
+        for event in events:
+            name = self._selectors.get(event.keys[0])
+            idx = per_tx[event.transaction_hash] = per_tx.get(event.transaction_hash, -1) + 1
+            if name is None:
+                continue
+            layout, fields = EVENTS[name], list(event.keys[1:]) + list(event.data)
+            account = _hex(fields[layout['account']])
+            token = _hex(fields[layout['token']]) if 'token' in layout else None
+            amount = fields[layout['amount']] + (fields[layout['amount'] + 1] << 128) if 'amount' in layout else None
+            cur = self.db.execute('INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  (_hex(event.transaction_hash), idx, event.block_number, _hex(contract), name,
+                                   account, token, None if amount is None else str(amount)))
+            if cur.rowcount == 0:
+                continue  # already indexed, e.g. re-run after a crash before checkpoint
+            applied += 1
+            if name == 'NewBinding':
+                self.db.execute('INSERT OR REPLACE INTO signers VALUES (?, ?, ?)',
+                                (account, _hex(fields[layout['signer']]), event.block_number))
+            else:
+                self._update_balance(name, account, token, amount)
+        return applied
+
+    def _update_balance(self, name: str, account: str, token: str, amount: int):
+        row = self.db.execute('SELECT deposited, withdrawn, pending FROM balances WHERE account = ? AND token = ?',
+                              (account, token)).fetchone()
+        deposited, withdrawn, pending = (int(v) for v in row) if row else (0, 0, 0)
+        if name == 'Deposit':
+            deposited += amount
+        elif name == 'ReqOnChainWithdrawal':
+            pending = amount
+        elif name == 'Withdrawal':
+            withdrawn += amount
+            pending = 0
+        self.db.execute('INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?, ?)',
+                        (account, token, str(deposited), str(withdrawn), str(pending)))
+
+    def signer_of(self, account) -> Optional[str]:
+        row = self.db.execute('SELECT signer FROM signers WHERE account = ?',
+                              (_hex(address_int(account)),)).fetchone()
+        return row[0] if row else None
+
+    def needs_binding(self, accounts: Iterable) -> List[str]:
+        return [_hex(address_int(a)) for a in accounts if self.signer_of(a) is None]
+
+    def pending_withdrawals(self, account=None) -> List[Tuple[str, str, int]]:
+        query, params = 'SELECT account, token, pending FROM balances WHERE pending != \'0\'', ()
+        if account is not None:
+            query, params = query + ' AND account = ?', (_hex(address_int(account)),)
+        return [(a, t, int(p)) for a, t, p in self.db.execute(query, params)]
+
+    def holders(self, account=None) -> List[Tuple[str, str, int]]:
+        """(account, token, deposited - withdrawn) for positive net deposits"""
+        query, params = 'SELECT account, token, deposited, withdrawn FROM balances', ()
+        if account is not None:
+            query, params = query + ' WHERE account = ?', (_hex(address_int(account)),)
+        out = []
+        for a, t, deposited, withdrawn in self.db.execute(query, params):
+            if int(deposited) > int(withdrawn):
+                out.append((a, t, int(deposited) - int(withdrawn)))
+        return out
+
+
+def indexer_from_config(cfg, db_path: str, start_block: int = 0) -> ChainIndexer:
+    """Indexer of the core and executor contracts of a CLIClient config"""
+    return ChainIndexer(FullNodeClient(node_url=cfg.node, session=runtime.session()),
+                        [cfg.core_address.as_int(), cfg.executor_address.as_int()], db_path,
+                        start_block=start_block, verbose=cfg.verbose)
+
+
+async def main():
+    from LayerAkira.src.CLIClient import CLIClient
+
+    parser = argparse.ArgumentParser(prog='ChainIndexer', description='Index LayerAkira contract events locally')
+    parser.add_argument('--toml_config_file', default='config.toml')
+    parser.add_argument('--db', default='chain_index.sqlite')
+    parser.add_argument('--from_block', type=int, default=0, help='first block to index on an empty database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('sync', help='index new events')
+    binding = sub.add_parser('needs_binding', help='accounts without a bound signer')
+    binding.add_argument('accounts', nargs='+')
+    sub.add_parser('pending', help='pending on-chain withdrawals')
+    sub.add_parser('holders', help='accounts with net deposits on the exchange contract')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO, filename='logs.txt')
+
+    indexer = indexer_from_config(CLIClient(args.toml_config_file).cli_cfg, args.db, args.from_block)
+    try:
+        if args.command == 'sync':
+            print(f"Indexed {await indexer.sync()} new events")
+        elif args.command == 'needs_binding':
+            print('\n'.join(indexer.needs_binding(args.accounts)))
+        elif args.command == 'pending':
+            for account, token, amount in indexer.pending_withdrawals():
+                print(f"{account} {token}: {amount}")
+        elif args.command == 'holders':
+            for account, token, amount in indexer.holders():
+                print(f"{account} {token}: {amount}")
+    finally:
+        indexer.close()
+
+
+if __name__ == "__main__":
+    run(main)
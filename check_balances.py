@@ -1,14 +1,17 @@
 import argparse
-import asyncio
 import logging
 import sys
 import os
 from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
 
 from LayerAkira.src.hasher.Hasher import AppDomain
-from LayerAkira.src.common.ERC20Token import ERC20Token
 
 from CustomCLIClient import CustomCLIClient
+from account_source import AccountRecord, KeyBackend, key_backend, open_account_source, trading_account
+from balance_history import BalanceHistory
+from portfolio_valuation import PortfolioValuation, parse_quotes
+from runtime import run, runtime
 
 
 @contextmanager
@@ -25,7 +28,9 @@ def suppress_stdout():
 
 class BalanceChecker(CustomCLIClient):
     
-    async def check_balances(self, domain):
+    async def check_balances(self, domain, quotes=None, threshold=0.0, history_dir=None,
+                             accounts: Optional[Iterable[AccountRecord]] = None, keys: Optional[KeyBackend] = None):
+        """Values cli_cfg.trading_account, or every account of an account source when given"""
         from starknet_py.net.full_node_client import FullNodeClient
         from LayerAkira.src.AkiraExchangeClient import AkiraExchangeClient
         from LayerAkira.src.HttpClient import AsyncApiHttpClient
@@ -33,7 +38,7 @@ class BalanceChecker(CustomCLIClient):
         from LayerAkira.src.hasher.Hasher import SnTypedPedersenHasher
         from starknet_py.hash.utils import message_signature
         
-        node_client = FullNodeClient(node_url=self.cli_cfg.node)
+        node_client = FullNodeClient(node_url=self.cli_cfg.node, session=runtime.session())
         erc_to_addr = {token.symbol: token.address for token in self.cli_cfg.tokens}
         contract_client = AkiraExchangeClient(node_client,
                                               self.cli_cfg.core_address,
@@ -60,10 +65,43 @@ class BalanceChecker(CustomCLIClient):
                                                verbose=self.cli_cfg.verbose)
 
         await self.exchange_client.init()
+        runtime.close_on_shutdown(api_client)
         
+        valuation = PortfolioValuation([token.symbol for token in self.cli_cfg.tokens], self._erc_to_decimals)
+        nonces = {}
+        if accounts is None:
+            await self.check_account(valuation, nonces, verbose=True)
+        else:
+            keys = keys or key_backend('env')
+            for account in accounts:
+                if runtime.stopping:
+                    print("Shutdown requested, valuing the accounts checked so far")
+                    break
+                try:
+                    self.cli_cfg.trading_account = trading_account(account, keys)
+                    if not await self.check_account(valuation, nonces, verbose=False):
+                        print(f"❌ {account.address}: could not read balances")
+                except Exception as e:
+                    print(f"❌ {account.address}: {e}")
+                    logging.exception(e)
+            print(f"Checked {len(valuation)} account(s)")
+
+        if not len(valuation):
+            return
+
+        print("\n=== Valuation ===")
+        valuation.value(quotes or {}, threshold).print()
+
+        if history_dir:
+            snapshot = BalanceHistory(history_dir).append_valuation(valuation, nonces)
+            print(f"\nSnapshot #{snapshot} saved to {history_dir}")
+
+    async def check_account(self, valuation: PortfolioValuation, nonces: Dict[str, int], verbose=True) -> bool:
+        """Reads exchange and on-chain balances of cli_cfg.trading_account into valuation"""
         trading_account = self.cli_cfg.trading_account[0]
         
-        print("=== Connecting to LayerAkira ===")
+        if verbose:
+            print("=== Connecting to LayerAkira ===")
         with suppress_stdout():
             await self.handle_request(self.exchange_client, 'set_account', self.cli_cfg.trading_account, 
                                     trading_account, self.cli_cfg.gas_fee_steps)
@@ -73,12 +111,14 @@ class BalanceChecker(CustomCLIClient):
                                                   trading_account, self.cli_cfg.gas_fee_steps)
         
         if auth_result and hasattr(auth_result, 'data'):
-            print("✅ Successful authorization")
+            if verbose:
+                print("✅ Successful authorization")
         else:
             print("❌ Authorization failed")
-            return
+            return False
         
-        print("\n=== LayerAkira Exchange Balances ===")
+        if verbose:
+            print("\n=== LayerAkira Exchange Balances ===")
         with suppress_stdout():
             user_info = await self.handle_request(self.exchange_client, 'user_info', [], 
                                                 trading_account, self.cli_cfg.gas_fee_steps)
@@ -87,34 +127,61 @@ class BalanceChecker(CustomCLIClient):
             balances = user_info.data.balances
             nonce = user_info.data.nonce
             
-            print(f"Nonce: {nonce}")
-            print("Balances:")
-            
-            total_value_found = False
-            for token_symbol, (balance, locked) in balances.items():
-                balance_float = float(balance) if balance != '0' else 0.0
-                locked_float = float(locked) if locked != '0' else 0.0
+            if verbose:
+                print(f"Nonce: {nonce}")
+                print("Balances:")
                 
-                if balance_float > 0 or locked_float > 0:
-                    print(f"  {token_symbol}: {balance_float:.6f} (locked: {locked_float:.6f})")
-                    total_value_found = True
-            
-            if not total_value_found:
-                print("  No funds on exchange")
+                total_value_found = False
+                for token_symbol, (balance, locked) in balances.items():
+                    balance_float = float(balance) if balance != '0' else 0.0
+                    locked_float = float(locked) if locked != '0' else 0.0
+                    
+                    if balance_float > 0 or locked_float > 0:
+                        print(f"  {token_symbol}: {balance_float:.6f} (locked: {locked_float:.6f})")
+                        total_value_found = True
+                
+                if not total_value_found:
+                    print("  No funds on exchange")
         else:
             print("❌ Failed to get balance information on exchange")
+            return False
+
+        onchain_raw = {}
+        try:
+            with suppress_stdout():
+                chain_info = await self.handle_request(self.exchange_client, 'refresh_chain_info', [],
+                                                       trading_account, self.cli_cfg.gas_fee_steps)
+            if isinstance(chain_info, tuple) and len(chain_info) >= 2:
+                onchain_raw = chain_info[1]
+        except Exception as e:
+            print(f"Error refreshing chain info: {e}")
+            logging.exception(e)
+
+        valuation.add_user_info(trading_account, balances, onchain_raw)
+        nonces[str(trading_account)] = nonce
+        return True
 
 
 async def main():
     parser = argparse.ArgumentParser(prog='BalanceChecker', description='Check balances on LayerAkira')
     parser.add_argument('--toml_config_file', default='config.toml')
+    parser.add_argument('--quote', action='append', help='token price used for valuation, e.g. --quote ETH=2500')
+    parser.add_argument('--threshold', type=float, default=0.0, help='report accounts worth at least this much')
+    parser.add_argument('--history_dir', default='balance_history', help='where balance snapshots are appended')
+    parser.add_argument('--accounts', help='check every account of a .csv, .jsonl or .sqlite account source '
+                                           'instead of the configured trading account')
+    parser.add_argument('--key_backend', choices=['env', 'keystore'], default='env')
+    parser.add_argument('--keystore_dir', default='keystore')
     args = parser.parse_args()
     
     logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO, filename='logs.txt')
     
     cli_client = BalanceChecker(args.toml_config_file)
-    await cli_client.check_balances(AppDomain(cli_client.cli_cfg.chain_id.value))
+    accounts = open_account_source(args.accounts) if args.accounts else None
+    await cli_client.check_balances(AppDomain(cli_client.cli_cfg.chain_id.value), parse_quotes(args.quote),
+                                    args.threshold, args.history_dir, accounts,
+                                    key_backend(args.key_backend, args.keystore_dir))
 
 
 if __name__ == "__main__":
-    asyncio.get_event_loop().run_until_complete(main()) 
\ No newline at end of file
+    run(main)
\ No newline at end of file
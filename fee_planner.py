@@ -0,0 +1,70 @@
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from typing import Dict, Iterable, Optional
+
+
+class FeePlan:
+    __slots__ = ('fee_token', 'fee_per_action', 'total_fee', 'amounts', 'kept', 'reason')
+
+    def __init__(self, fee_token=None, fee_per_action=Decimal(0), total_fee=Decimal(0), amounts=None, kept=None,
+                 reason=''):
+        self.fee_token = fee_token
+        self.fee_per_action = fee_per_action
+        self.total_fee = total_fee
+        self.amounts: Dict[str, Decimal] = amounts or {}
+        self.kept: Dict[str, str] = kept or {}  # requested tokens left on the account -> why
+        self.reason = reason
+
+    def __repr__(self):
+        if self.fee_token is None:
+            return f'FeePlan(infeasible: {self.reason})'
+        return f'FeePlan(fee in {self.fee_token}: {self.fee_per_action} x {len(self.amounts)} = {self.total_fee})'
+
+
+class FeePlanner:
+    """Works out one account's withdrawal amounts net of gas.
+
+    Gas is paid in fee_token, the token the SDK charges (STRK). Every other token is withdrawn in
+    full above its reserve, unless that is below its min_amounts entry. The fee token pays for all
+    withdrawals, keeps its own reserve and is withdrawn last with whatever is left. It is only
+    withdrawn when what is left reaches its minimum, which is at least one fee: a withdrawal of
+    less would cost more gas than it moves."""
+
+    def __init__(self, erc_to_decimals: Dict[str, int], fee_token: str = 'STRK',
+                 reserves: Optional[Dict[str, Decimal]] = None, min_amounts: Optional[Dict[str, Decimal]] = None):
+        self.decimals = {str(k): v for k, v in erc_to_decimals.items()}
+        self.fee_token = fee_token
+        self.reserves = reserves or {}
+        self.min_amounts = {str(t): Decimal(str(a)) for t, a in (min_amounts or {}).items()}
+
+    def _quantize(self, token: str, amount: Decimal, rounding=ROUND_DOWN) -> Decimal:
+        return amount.quantize(Decimal(1).scaleb(-self.decimals.get(token, 18)), rounding=rounding)
+
+    def plan(self, balances: Dict[str, Decimal], fee_per_action: Decimal,
+             withdraw_tokens: Optional[Iterable[str]] = None) -> FeePlan:
+        """balances: token -> human amount available, withdraw_tokens: which of them to withdraw
+        (default all), fee_per_action: gas of one withdrawal in fee token base units"""
+        balances = {str(t): Decimal(str(b)) for t, b in balances.items()}
+        withdraw_tokens = set(balances) if withdraw_tokens is None else {str(t) for t in withdraw_tokens}
+        token = self.fee_token
+        fee = self._quantize(token, Decimal(fee_per_action).scaleb(-self.decimals.get(token, 18)), ROUND_UP)
+        amounts = {t: b - self.reserves.get(t, Decimal(0)) for t, b in balances.items() if t in withdraw_tokens}
+        kept = {t: 'nothing above reserve' for t, a in amounts.items() if a <= 0}
+        kept.update({t: f'{a} is below the minimum withdrawal {self.min_amounts[t]}' for t, a in amounts.items()
+                     if 0 < a < self.min_amounts.get(t, 0) and t != token})
+        amounts = {t: a for t, a in amounts.items() if t not in kept and t != token}
+        own = balances.get(token, Decimal(0)) - self.reserves.get(token, Decimal(0))
+        total = fee * (len(amounts) + 1)
+        left = self._quantize(token, own - total)
+        minimum = max(fee, self.min_amounts.get(token, Decimal(0)))
+        if token in withdraw_tokens and left > 0 and left >= minimum:
+            amounts[token] = left
+        else:
+            # not worth withdrawing the fee token itself, it only has to cover the others
+            total = fee * len(amounts)
+            if own < total:
+                return FeePlan(reason=f'not enough {token} for gas: need {total}, have {max(own, Decimal(0))} '
+                                      f'above reserve')
+            if token in withdraw_tokens:
+                kept.setdefault(token, f'{own - total} left after {total} gas is below the minimum withdrawal '
+                                       f'{minimum}')
+        return FeePlan(token, fee, total, amounts, kept)
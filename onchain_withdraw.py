@@ -5,6 +5,7 @@ import os
 import sys
 from contextlib import contextmanager
 from decimal import Decimal
+from typing import Optional
 
 from LayerAkira.src.common.ContractAddress import ContractAddress
 from LayerAkira.src.common.ERC20Token import ERC20Token
@@ -12,6 +13,12 @@ from LayerAkira.src.hasher.Hasher import AppDomain
 from LayerAkira.src.common.Requests import Withdraw, GasFee, SignScheme
 
 from CustomCLIClient import CustomCLIClient
+from chain_indexer import ChainIndexer
+from fee_planner import FeePlanner
+from preflight import ONCHAIN_WITHDRAW, PlannedWithdrawal, WithdrawOutcome, WithdrawPreflight, gas_price_of
+from receipt_tracker import ReceiptTracker
+from rpc_batch import JsonRpcBatch
+from runtime import run, runtime
 
 
 @contextmanager
@@ -27,7 +34,8 @@ def suppress_stdout():
 
 class OnChainWithdrawClient(CustomCLIClient):
 
-    async def check_and_withdraw_onchain_balances(self, domain):
+    async def check_and_withdraw_onchain_balances(self, domain, index_db=None, assume_yes=False,
+                                                  tracker: Optional[ReceiptTracker] = None):
         from starknet_py.net.full_node_client import FullNodeClient
         from LayerAkira.src.AkiraExchangeClient import AkiraExchangeClient
         from LayerAkira.src.HttpClient import AsyncApiHttpClient
@@ -35,7 +43,7 @@ class OnChainWithdrawClient(CustomCLIClient):
         from LayerAkira.src.hasher.Hasher import SnTypedPedersenHasher
         from starknet_py.hash.utils import message_signature
 
-        node_client = FullNodeClient(node_url=self.cli_cfg.node)
+        node_client = FullNodeClient(node_url=self.cli_cfg.node, session=runtime.session())
         erc_to_addr = {token.symbol: token.address for token in self.cli_cfg.tokens}
         contract_client = AkiraExchangeClient(node_client,
                                               self.cli_cfg.core_address,
@@ -62,6 +70,34 @@ class OnChainWithdrawClient(CustomCLIClient):
                                                verbose=self.cli_cfg.verbose)
 
         await self.exchange_client.init()
+        runtime.close_on_shutdown(api_client)
+
+        # signer bindings already seen by chain_indexer.py spare the get_signer calls here and in the preflight
+        indexer = ChainIndexer(node_client,
+                               [self.cli_cfg.core_address.as_int(), self.cli_cfg.executor_address.as_int()],
+                               index_db) if index_db else None
+        if indexer is not None:
+            runtime.on_shutdown(indexer.close)
+
+        # a shared tracker (sweep_coordinator.py) outlives this account, its owner settles the outcome
+        shared = tracker is not None
+        if shared:
+            rpc = tracker.rpc
+        else:
+            rpc = JsonRpcBatch(self.cli_cfg.node, runtime.session(), verbose=self.cli_cfg.verbose)
+            tracker = ReceiptTracker(rpc, verbose=self.cli_cfg.verbose)
+        outcome = WithdrawOutcome()
+
+        async def wait_for_receipts():
+            if shared:
+                return outcome
+            await outcome.settle()
+            if outcome.transactions:
+                print(f"\n=== Confirmed {len(outcome.transactions)} transaction(s) ===")
+            for tx_hash, status in outcome.transactions.items():
+                print(f"{'❌' if status.startswith('failed') else '✅'} {tx_hash}: {status}")
+            await rpc.close()
+            return outcome
 
         trading_account = self.cli_cfg.trading_account[0]
 
@@ -72,21 +108,28 @@ class OnChainWithdrawClient(CustomCLIClient):
 
         print("=== Checking signer binding ===")
         try:
-            signer_result = await contract_client.get_signer(trading_account)
-            current_signer: ContractAddress = signer_result.data if hasattr(signer_result, 'data') else signer_result
-            print(current_signer)
-
-            if current_signer.as_int() == 0 or current_signer is None:
-                print("Signer not bound, binding to signer...")
-                with suppress_stdout():
-                    bind_result = await self.handle_request(self.exchange_client, 'bind_to_signer', [],
-                                                            trading_account, self.cli_cfg.gas_fee_steps)
-                print(f"Bind result: {bind_result}")
+            indexed_signer = indexer.signer_of(trading_account) if indexer is not None else None
+            if indexed_signer is not None:
+                print(f"Signer already bound (local index): {indexed_signer}")
             else:
-                print(f"Signer already bound: {current_signer}")
+                signer_result = await contract_client.get_signer(trading_account)
+                current_signer: ContractAddress = signer_result.data if hasattr(signer_result, 'data') \
+                    else signer_result
+                print(current_signer)
+
+                if current_signer.as_int() == 0 or current_signer is None:
+                    print("Signer not bound, binding to signer...")
+                    with suppress_stdout():
+                        bind_result = await self.handle_request(self.exchange_client, 'bind_to_signer', [],
+                                                                trading_account, self.cli_cfg.gas_fee_steps)
+                    print(f"Bind result: {bind_result}")
+                    outcome.track(tracker, bind_result)
+                else:
+                    print(f"Signer already bound: {current_signer}")
         except Exception as e:
             print(f"Error checking signer: {e}")
             logging.exception(e)
+            outcome.fail('signer', e)
 
         print("=== Authorization ===")
         with suppress_stdout():
@@ -95,6 +138,7 @@ class OnChainWithdrawClient(CustomCLIClient):
         print(f"Authorization: {auth_result}")
 
         print("=== Updating gas price ===")
+        gas_result = None
         try:
             with suppress_stdout():
                 gas_result = await self.handle_request(self.exchange_client, 'query_gas_price', [],
@@ -122,9 +166,8 @@ class OnChainWithdrawClient(CustomCLIClient):
         except Exception as e:
             print(f"Error refreshing chain info: {e}")
             logging.exception(e)
-            print("Waiting 3 seconds before closing connections...")
-            await asyncio.sleep(3)
-            return
+            outcome.fail('chain_info', e)
+            return await wait_for_receipts()
 
         # Get on-chain balances from chain info
         onchain_balances = {}
@@ -162,52 +205,113 @@ class OnChainWithdrawClient(CustomCLIClient):
                         print(f"  {token_symbol}: 0")
             else:
                 print(f"Unexpected chain info result format: {chain_info_result}")
+                outcome.fail('chain_info', f'unexpected result {chain_info_result}')
         else:
             print(f"Failed to get chain info, result: {chain_info_result}")
+            outcome.fail('chain_info', f'no result {chain_info_result}')
 
         if not tokens_with_balance:
             print("\nNo on-chain balances found.")
-            print("Waiting 3 seconds before closing connections...")
-            await asyncio.sleep(3)
-            return
+            return await wait_for_receipts()
 
         print(f"\nFound balances for: {', '.join(tokens_with_balance)}")
 
         # Ask user if they want to withdraw
-        while True:
+        while not assume_yes:
             try:
-                # break
                 user_input = input("\nDo you want to withdraw all on-chain balances? (y/n): ").strip().lower()
                 if user_input in ['y', 'yes', 'да', 'д']:
                     break
                 elif user_input in ['n', 'no', 'нет', 'н']:
                     print("Withdrawal cancelled.")
-                    print("Waiting 3 seconds before closing connections...")
-                    await asyncio.sleep(3)
-                    return
+                    for token_symbol in tokens_with_balance:
+                        outcome.skip(token_symbol, 'cancelled by user')
+                    return await wait_for_receipts()
                 else:
                     print("Please enter 'y' for yes or 'n' for no.")
             except KeyboardInterrupt:
                 print("\nOperation cancelled by user.")
-                return
+                return outcome
 
         print("\n=== Starting on-chain withdrawal process ===")
 
         # Step 1: Request withdrawal for all tokens with balance
         withdrawal_requests = []
 
-        for token_symbol in tokens_with_balance:
-            balance_human = onchain_balances[token_symbol]
-            
-            # For STRK, leave 1 token on balance
-            if token_symbol == 'STRK':
-                if balance_human <= Decimal('1.0'):
-                    print(f"Skipping {token_symbol}: insufficient balance for withdrawal (need > 1 STRK, have {balance_human})")
-                    continue
-                withdraw_amount = balance_human - Decimal('1.0')
-            else:
-                withdraw_amount = balance_human
-            
+        async def add_pending_withdrawal(token_symbol, withdraw_amount):
+            try:
+                # Get token address for the contract call
+                token_address = None
+                for token_config in self.cli_cfg.tokens:
+                    if token_config.symbol == token_symbol:
+                        token_address = token_config.address
+                        break
+
+                if token_address:
+                    # Get pending withdrawal key
+                    pending_result = await contract_client.get_pending_withdraw(trading_account, token_address)
+
+                    if pending_result and hasattr(pending_result, 'data') and pending_result.data:
+                        pending_key = pending_result.data
+                        print(f"📋 Found pending withdrawal key for {token_symbol}: {pending_key}")
+                        logging.info(f"Found pending withdrawal key for {token_symbol}: {pending_key}")
+
+                        # Add to withdrawal requests with pending key
+                        withdrawal_requests.append((token_symbol, withdraw_amount, pending_key))
+                    else:
+                        print(f"❌ Could not get pending withdrawal key for {token_symbol}: {pending_result}")
+                        outcome.fail(token_symbol, f'no pending withdrawal key: {pending_result}')
+                        logging.warning(
+                            f"Could not get pending withdrawal key for {token_symbol}: {pending_result}")
+                else:
+                    print(f"❌ Could not find token address for {token_symbol}")
+                    logging.warning(f"Could not find token address for {token_symbol}")
+                    outcome.fail(token_symbol, 'unknown token address')
+
+            except Exception as pending_error:
+                print(f"❌ Error getting pending withdrawal for {token_symbol}: {pending_error}")
+                logging.exception(f"Error getting pending withdrawal for {token_symbol}: {pending_error}")
+                outcome.fail(token_symbol, pending_error)
+
+        plans = [PlannedWithdrawal(trading_account, token_symbol, onchain_balances[token_symbol], ONCHAIN_WITHDRAW)
+                 for token_symbol in tokens_with_balance]
+
+        # Preflight: gas, pending requests and fee-adjusted amounts for all tokens in one batched RPC call.
+        # The planner keeps 1 STRK on balance and takes gas from the STRK withdrawal, which goes last
+        planner = FeePlanner(self._erc_to_decimals, reserves={'STRK': Decimal(1)})
+        preflight = WithdrawPreflight(rpc, self.cli_cfg.core_address.as_int(),
+                                      {token.symbol: token.address.as_int() for token in self.cli_cfg.tokens},
+                                      self._erc_to_decimals, self.cli_cfg.gas_fee_steps, self.cli_cfg.gas_multiplier,
+                                      planner, indexer)
+        try:
+            await preflight.run(plans, {trading_account: onchain_balances}, gas_price=gas_price_of(gas_result))
+            for plan in plans:
+                print(f"Preflight: {plan}")
+        except Exception as e:
+            print(f"Preflight failed, requesting without checks: {e}")
+            logging.exception(e)
+            for plan in plans:
+                plan.net_amount = plan.amount - planner.reserves.get(plan.token, Decimal(0))
+                if plan.net_amount <= 0:
+                    plan.reject('nothing above reserve')
+
+        for i, plan in enumerate(plans):
+            token_symbol, withdraw_amount = plan.token, plan.net_amount
+            if runtime.stopping:
+                print("Shutdown requested, not requesting further withdrawals")
+                for rest in plans[i:]:
+                    if rest.ok or rest.pending:
+                        outcome.fail(rest.token, 'shutdown requested')
+                break
+            if plan.pending:
+                print(f"⚠️ Previous withdrawal for {token_symbol} not completed yet. Getting pending withdrawal key...")
+                await add_pending_withdrawal(token_symbol, withdraw_amount)
+                continue
+            if not plan.ok:
+                print(f"Skipping {token_symbol}: {plan.reason}")
+                outcome.skip(token_symbol, plan.reason)
+                continue
+
             # Format human readable amount for display and API
             balance_str = f"{withdraw_amount:.30f}".rstrip('0').rstrip('.')
             print(f"Requesting withdrawal for {token_symbol}: {balance_str}")
@@ -227,6 +331,7 @@ class OnChainWithdrawClient(CustomCLIClient):
                     print(f"✅ Withdrawal request for {token_symbol}: {request_result}")
                 else:
                     print(f"❌ Failed to request withdrawal for {token_symbol} res {request_result}")
+                    outcome.fail(token_symbol, f'request_withdraw_on_chain returned {request_result}')
 
                 await asyncio.sleep(2)
 
@@ -241,43 +346,13 @@ class OnChainWithdrawClient(CustomCLIClient):
                         f"⚠️ Previous withdrawal for {token_symbol} not completed yet. Trying to get pending withdrawal key...")
                     logging.info(
                         f"Previous withdrawal for {token_symbol} not completed, getting pending withdrawal key")
-
-                    try:
-                        # Get token address for the contract call
-                        token_address = None
-                        for token_config in self.cli_cfg.tokens:
-                            if token_config.symbol == token_symbol:
-                                token_address = token_config.address
-                                break
-
-                        if token_address:
-                            # Get pending withdrawal key
-                            pending_result = await contract_client.get_pending_withdraw(trading_account, token_address)
-
-                            if pending_result and hasattr(pending_result, 'data') and pending_result.data:
-                                pending_key = pending_result.data
-                                print(f"📋 Found pending withdrawal key for {token_symbol}: {pending_key}")
-                                logging.info(f"Found pending withdrawal key for {token_symbol}: {pending_key}")
-
-                                # Add to withdrawal requests with pending key
-                                withdrawal_requests.append((token_symbol, withdraw_amount, pending_key))
-                            else:
-                                print(f"❌ Could not get pending withdrawal key for {token_symbol}: {pending_result}")
-                                logging.warning(
-                                    f"Could not get pending withdrawal key for {token_symbol}: {pending_result}")
-                        else:
-                            print(f"❌ Could not find token address for {token_symbol}")
-                            logging.warning(f"Could not find token address for {token_symbol}")
-
-                    except Exception as pending_error:
-                        print(f"❌ Error getting pending withdrawal for {token_symbol}: {pending_error}")
-                        logging.exception(f"Error getting pending withdrawal for {token_symbol}: {pending_error}")
+                    await add_pending_withdrawal(token_symbol, withdraw_amount)
+                else:
+                    outcome.fail(token_symbol, e)
 
         if not withdrawal_requests:
             print("No successful withdrawal requests.")
-            print("Waiting 3 seconds before closing connections...")
-            await asyncio.sleep(3)
-            return
+            return await wait_for_receipts()
 
         print(f"\n=== Applying {len(withdrawal_requests)} withdrawal(s) ===")
 
@@ -346,6 +421,7 @@ class OnChainWithdrawClient(CustomCLIClient):
                         print(f"Calculated withdrawal key: {withdrawal_key}")
                     else:
                         print(f"❌ Could not find token config for address {token_addr}")
+                        outcome.fail(token_symbol, f'unknown token {token_addr}')
                         continue
 
                 elif hasattr(request_result, 'data'):
@@ -368,9 +444,12 @@ class OnChainWithdrawClient(CustomCLIClient):
                             )
                         if apply_result:
                             print(f"✅ Applied withdrawal for {token_symbol}: {apply_result}")
+                            outcome.track(tracker, apply_result)
+                            outcome.submit(token_symbol, amount_str)
                             break
                         else:
                             print(f"❌ Failed to apply withdrawal for {token_symbol} res {apply_result}")
+                            outcome.fail(token_symbol, f'apply_onchain_withdraw returned {apply_result}')
                             break
                         await asyncio.sleep(3)
                     except Exception as e:
@@ -427,33 +506,36 @@ class OnChainWithdrawClient(CustomCLIClient):
                             else:
                                 print(f"❌ Could not parse block/timestamp from error")
                                 logging.warning(f"Could not parse block/timestamp from error: {error_str}")
+                                outcome.fail(token_symbol, error_str)
                                 break
                         else:
+                            outcome.fail(token_symbol, error_str)
                             break
                     await asyncio.sleep(3)
 
             except Exception as e:
                 print(f"❌ Error processing withdrawal for {token_symbol}: {e}")
                 logging.exception(f"Error processing withdrawal for {token_symbol}: {e}")
+                outcome.fail(token_symbol, e)
 
         print("\n=== On-chain withdrawal process completed ===")
         print("Note: On-chain withdrawals may take some time to be processed on the blockchain.")
 
-        print("Waiting 3 seconds before closing connections...")
-        await asyncio.sleep(3)
+        return await wait_for_receipts()
 
 
 async def main():
     parser = argparse.ArgumentParser(prog='OnChainWithdrawScript',
                                      description='Check and withdraw on-chain balances from LayerAkira')
     parser.add_argument('--toml_config_file', default='config.toml')
+    parser.add_argument('--index_db', help='chain_indexer.py database used to skip per-account signer reads')
     args = parser.parse_args()
 
     logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO, filename='logs.txt')
 
     cli_client = OnChainWithdrawClient(args.toml_config_file)
-    await cli_client.check_and_withdraw_onchain_balances(AppDomain(cli_client.cli_cfg.chain_id.value))
+    await cli_client.check_and_withdraw_onchain_balances(AppDomain(cli_client.cli_cfg.chain_id.value), args.index_db)
 
 
 if __name__ == "__main__":
-    asyncio.get_event_loop().run_until_complete(main())
+    run(main)
@@ -0,0 +1,117 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+PairKey = Tuple[str, str]  # (base symbol, quote symbol), e.g. ('ETH', 'USDC')
+
+
+def _field(payload, *names, default=None):
+    """Reads the first present field from a dict-like or attribute-style payload"""
+    for name in names:
+        if isinstance(payload, dict):
+            if name in payload:
+                return payload[name]
+        elif hasattr(payload, name):
+            return getattr(payload, name)
+    return default
+
+
+def _levels(raw) -> List[Tuple[int, int]]:
+    """Normalizes [(price, qty, ...), ...] or [{'price':..., 'volume':...}, ...] into (price, qty) pairs"""
+    if not raw:
+        return []
+    out = []
+    for level in raw:
+        if isinstance(level, (list, tuple)):
+            out.append((level[0], level[1]))
+        else:
+            out.append((_field(level, 'price', 'px'), _field(level, 'volume', 'qty', 'quantity', 'size')))
+    return out
+
+
+class PriceLevels:
+    """One side of the book. Prices are kept sorted ascending in a plain list,
+    quantities live in a dict, so the best level is always at one end of the list."""
+    __slots__ = ('_prices', '_qty', '_is_bid')
+
+    def __init__(self, is_bid: bool):
+        self._prices: List = []
+        self._qty: Dict = {}
+        self._is_bid = is_bid
+
+    def load(self, levels: List[Tuple[int, int]]):
+        self._qty = {price: qty for price, qty in levels if qty}
+        self._prices = sorted(self._qty)
+
+    def best(self) -> Optional[Tuple[int, int]]:
+        if not self._prices:
+            return None
+        price = self._prices[-1] if self._is_bid else self._prices[0]
+        return price, self._qty[price]
+
+    def depth(self, n: int) -> List[Tuple[int, int]]:
+        prices = self._prices[:-n - 1:-1] if self._is_bid else self._prices[:n]
+        return [(p, self._qty[p]) for p in prices]
+
+
+class LocalOrderBook:
+    """In-memory L2 book for one traded pair. The exchange's snap stream re-sends the whole book on
+    every update, so each message replaces both sides; there are no deltas to sequence."""
+
+    def __init__(self, pair: PairKey):
+        self.pair = pair
+        self.bids = PriceLevels(is_bid=True)
+        self.asks = PriceLevels(is_bid=False)
+        self.seq: Optional[int] = None
+        self.synced = False
+
+    def apply_snapshot(self, bids, asks, seq: Optional[int]):
+        if seq is not None and self.seq is not None and seq <= self.seq:
+            return  # stale or duplicated message
+        self.bids.load(_levels(bids))
+        self.asks.load(_levels(asks))
+        if seq is not None:
+            self.seq = seq
+        self.synced = True
+
+    def best_bid(self) -> Optional[Tuple[int, int]]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[Tuple[int, int]]:
+        return self.asks.best()
+
+    def depth(self, n: int = 10):
+        return {'bids': self.bids.depth(n), 'asks': self.asks.depth(n)}
+
+    def __repr__(self):
+        return f'LocalOrderBook({self.pair}, seq={self.seq}, synced={self.synced}, ' \
+               f'bid={self.best_bid()}, ask={self.best_ask()})'
+
+
+class OrderBookManager:
+    """Keeps one LocalOrderBook per traded pair and feeds them from snap subscribe_book streams"""
+
+    def __init__(self, verbose=False):
+        self.books: Dict[PairKey, LocalOrderBook] = {}
+        self.verbose = verbose
+
+    def book(self, base: str, quote: str) -> LocalOrderBook:
+        key = (base, quote)
+        if key not in self.books:
+            self.books[key] = LocalOrderBook(key)
+        return self.books[key]
+
+    def get(self, base: str, quote: str) -> Optional[LocalOrderBook]:
+        book = self.books.get((base, quote))
+        return book if book is not None and book.synced else None
+
+    def consumer(self, base: str, quote: str):
+        book = self.book(base, quote)
+
+        async def consume(payload):
+            data = _field(payload, 'result', 'data', default=payload)
+            book.apply_snapshot(_field(data, 'bids', default=[]), _field(data, 'asks', default=[]),
+                                _field(data, 'msg_id', 'seq', 'sequence'))
+            if self.verbose:
+                logging.info(f'Book update {book}')
+
+        return consume
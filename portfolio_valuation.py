@@ -0,0 +1,113 @@
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FREE, LOCKED, ONCHAIN = 0, 1, 2
+
+
+def parse_quotes(raw: Optional[List[str]]) -> Dict[str, float]:
+    """Parses ['ETH=2500', 'STRK=0.45'] into {'ETH': 2500.0, 'STRK': 0.45}"""
+    quotes = {}
+    for item in raw or []:
+        symbol, price = item.split('=', 1)
+        quotes[symbol.strip()] = float(price)
+    return quotes
+
+
+class ValuationReport:
+
+    def __init__(self, accounts: List[str], tokens: List[str], holdings: np.ndarray, prices: np.ndarray,
+                 priced: np.ndarray, threshold: float):
+        self.accounts = accounts
+        self.tokens = tokens
+        self.holdings = holdings  # accounts x tokens, human units (free + locked + on-chain)
+        self.values = holdings * prices
+        self.account_totals = self.values.sum(axis=1)
+        self.token_amounts = holdings.sum(axis=0)
+        self.token_values = self.values.sum(axis=0)
+        self.total = float(self.account_totals.sum())
+        self.unpriced = [t for t, p, amount in zip(tokens, priced, self.token_amounts) if not p and amount > 0]
+        self.threshold = threshold
+        self.above_threshold = np.flatnonzero(self.account_totals >= threshold) if threshold > 0 \
+            else np.flatnonzero(self.account_totals > 0)
+
+    def accounts_above_threshold(self) -> List[str]:
+        return [self.accounts[i] for i in self.above_threshold]
+
+    def print(self, max_accounts: int = 20):
+        print(f"Accounts: {len(self.accounts)}, total value: {self.total:.6f}")
+        print("Per-token exposure:")
+        for token, amount, value in zip(self.tokens, self.token_amounts, self.token_values):
+            if amount > 0:
+                print(f"  {token}: {amount:.6f} (value: {value:.6f})")
+        if self.unpriced:
+            print(f"  No quote for: {', '.join(self.unpriced)} (valued at 0)")
+        print(f"Accounts with value >= {self.threshold}: {len(self.above_threshold)}")
+        order = self.above_threshold[np.argsort(-self.account_totals[self.above_threshold])]
+        for i in order[:max_accounts]:
+            print(f"  {self.accounts[i]}: {self.account_totals[i]:.6f}")
+
+
+class PortfolioValuation:
+    """Collects free / locked / on-chain balances of many accounts into an
+    accounts x tokens x 3 float matrix and values it against quotes in one pass"""
+
+    def __init__(self, tokens: List[str], erc_to_decimals: Dict[str, int], capacity: int = 64):
+        self.tokens = [str(t) for t in tokens]
+        self.token_index = {t: i for i, t in enumerate(self.tokens)}
+        decimals = {str(t): d for t, d in erc_to_decimals.items()}
+        # NaN marks tokens without configured decimals, their base-unit amounts cannot be converted
+        self.scale = np.array([10.0 ** -decimals[t] if t in decimals else np.nan for t in self.tokens])
+        self.accounts: List[str] = []
+        self._data = np.zeros((capacity, len(self.tokens), 3))
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _row(self, account: str) -> int:
+        if len(self.accounts) == self._data.shape[0]:
+            self._data = np.concatenate([self._data, np.zeros_like(self._data)])
+        self.accounts.append(account)
+        return len(self.accounts) - 1
+
+    def _fill(self, row: int, kind: int, balances: Dict, raw: bool):
+        if not balances:
+            return
+        cols, values = [], []
+        for symbol, amount in balances.items():
+            col = self.token_index.get(str(symbol))
+            if col is None:
+                continue
+            cols.append(col)
+            values.append(float(Decimal(str(amount))))
+        values = np.array(values)
+        if raw:
+            values *= self.scale[cols]
+        self._data[row, cols, kind] = values
+
+    def add_account(self, account: str, free: Dict = None, locked: Dict = None, onchain_raw: Dict = None):
+        """free/locked come from user_info in human units, onchain_raw from refresh_chain_info in base units"""
+        missing = [str(t) for t in onchain_raw or {}
+                   if str(t) in self.token_index and np.isnan(self.scale[self.token_index[str(t)]])]
+        if missing:
+            raise Exception(f'No decimals configured for {", ".join(missing)}, cannot convert base units')
+        row = self._row(str(account))
+        self._fill(row, FREE, free, raw=False)
+        self._fill(row, LOCKED, locked, raw=False)
+        self._fill(row, ONCHAIN, onchain_raw, raw=True)
+
+    def add_user_info(self, account: str, balances: Dict, onchain_raw: Dict = None):
+        """balances is user_info.data.balances: {token: (balance, locked)}"""
+        self.add_account(account,
+                         {t: b for t, (b, _) in balances.items()},
+                         {t: l for t, (_, l) in balances.items()},
+                         onchain_raw)
+
+    def matrix(self, kinds=(FREE, LOCKED, ONCHAIN)) -> np.ndarray:
+        return self._data[:len(self.accounts), :, list(kinds)].sum(axis=2)
+
+    def value(self, quotes: Dict[str, float], threshold: float = 0, kinds=(FREE, LOCKED, ONCHAIN)) -> ValuationReport:
+        prices = np.array([quotes.get(t, 0.0) for t in self.tokens])
+        priced = np.array([t in quotes for t in self.tokens])
+        return ValuationReport(self.accounts, self.tokens, self.matrix(kinds), prices, priced, threshold)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from fee_planner import FeePlanner
+from receipt_tracker import ReceiptTracker, tx_hash_of
+from rpc_batch import JsonRpcBatch, RpcError, address_int, call_request, felts
+
+WITHDRAW, ONCHAIN_WITHDRAW = 'withdraw', 'onchain_withdraw'
+
+
+def gas_steps(gas_fee_steps, action: str, ecosystem: bool = True) -> int:
+    """Steps configured in [[gas_action]] for action, 0 if it is not configured"""
+    try:
+        return int(gas_fee_steps[action][ecosystem])
+    except (KeyError, IndexError, TypeError):
+        return 0
+
+
+def gas_price_of(result) -> Optional[int]:
+    """Gas price from a query_gas_price result, the price the SDK signs GasFee.max_gas_price with"""
+    price = getattr(result, 'data', result)
+    return price if isinstance(price, int) and not isinstance(price, bool) and price > 0 else None
+
+
+class PlannedWithdrawal:
+    __slots__ = ('account', 'token', 'amount', 'action', 'net_amount', 'fee', 'fee_token', 'ok', 'reason',
+                 'pending')
+
+    def __init__(self, account, token: str, amount: Decimal, action: str = WITHDRAW):
+        self.account = account
+        self.token = token
+        self.amount = amount
+        self.action = action
+        self.net_amount = amount
+        self.fee = Decimal(0)
+        self.fee_token = None
+        self.ok = True
+        self.reason = ''
+        self.pending = False
+
+    def reject(self, reason: str):
+        self.ok, self.reason = False, reason
+
+    def __repr__(self):
+        state = 'ok' if self.ok else f'skip: {self.reason}'
+        fee = f'{self.fee:f} {self.fee_token}' if self.fee_token else f'{self.fee:f}'
+        return f'{self.token} {self.action} {self.amount} -> {self.net_amount} (fee {fee}, {state})'
+
+
+class WithdrawOutcome:
+    """What a withdrawal run did per token, returned by the scripts and stored by sweep_coordinator.py"""
+    __slots__ = ('submitted', 'skipped', 'failed', 'transactions', 'receipts')
+
+    def __init__(self):
+        self.submitted: Dict[str, str] = {}
+        self.skipped: Dict[str, str] = {}
+        self.failed: Dict[str, str] = {}
+        self.transactions: Dict[str, str] = {}  # tx hash -> final status or error
+        self.receipts: Dict[int, asyncio.Future] = {}  # tracked, not yet recorded
+
+    def submit(self, token: str, amount):
+        self.submitted[token] = f'{amount}'
+
+    def skip(self, token: str, reason: str):
+        self.skipped[token] = reason
+
+    def fail(self, token: str, error):
+        self.failed[token] = str(error)
+
+    def track(self, tracker: ReceiptTracker, result) -> Optional[asyncio.Future]:
+        """Hands the transaction behind a request result to tracker, None if it carries no hash"""
+        tx_hash = tx_hash_of(result)
+        if tx_hash is None:
+            return None
+        future = self.receipts[tx_hash] = tracker.track(tx_hash)
+        return future
+
+    async def settle(self) -> 'WithdrawOutcome':
+        """Waits for this run's tracked transactions and records their final status"""
+        hashes = list(self.receipts)
+        results = await asyncio.gather(*self.receipts.values(), return_exceptions=True)
+        self.record_receipts(dict(zip(hashes, results)))
+        self.receipts.clear()
+        return self
+
+    def record_receipts(self, results: Dict[int, object]):
+        for tx_hash, status in results.items():
+            self.transactions[hex(tx_hash)] = status if isinstance(status, str) else f'failed: {status}'
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not any(s.startswith('failed') for s in self.transactions.values())
+
+    def to_dict(self) -> Dict:
+        return {'submitted': self.submitted, 'skipped': self.skipped, 'failed': self.failed,
+                'transactions': self.transactions}
+
+    def __repr__(self):
+        return f'WithdrawOutcome({self.to_dict()})'
+
+
+class WithdrawPreflight:
+    """Checks a set of planned withdrawals before anything is submitted.
+
+    One JSON-RPC batch reads the signer of every account the optional
+    chain_indexer.py index has no binding for and, for on-chain withdrawals, whether a previous
+    request is still pending (always read live, the index may lag behind).
+    Bindings are permanent, so an indexed signer is never stale. Gas is priced with the exchange's
+    gas price when the caller has it, otherwise with the l1 gas price of the latest block read in
+    the same batch. The planner then subtracts gas (steps * gas price * multiplier) and reserves, so amounts come out net of fees, the fee token is
+    withdrawn last and withdrawals that cannot succeed are rejected instead of sent."""
+
+    def __init__(self, rpc: JsonRpcBatch, core_address: int, token_addresses: Dict[str, int],
+                 erc_to_decimals: Dict[str, int], gas_fee_steps, gas_multiplier: float = 1,
+                 planner: Optional[FeePlanner] = None, indexer=None):
+        self.rpc = rpc
+        self.core_address = core_address
+        self.token_addresses = token_addresses
+        self.gas_fee_steps = gas_fee_steps
+        self.gas_multiplier = Decimal(str(gas_multiplier))
+        self.planner = planner or FeePlanner(erc_to_decimals)
+        self.indexer = indexer
+        self.gas_price: Optional[int] = None
+
+    def native_fee_per_action(self, action: str) -> Decimal:
+        """Gas of one action in native (STRK) base units"""
+        return Decimal(gas_steps(self.gas_fee_steps, action) * (self.gas_price or 0)) * self.gas_multiplier
+
+    async def run(self, plans: List[PlannedWithdrawal], balances: Dict[str, Dict[str, Decimal]],
+                  assume_bound: Iterable = (), gas_price: Optional[int] = None) -> List[PlannedWithdrawal]:
+        """balances: account -> token -> human amount the withdrawals (and their gas) are taken from,
+        assume_bound: accounts whose bind_to_signer was just sent and may not show up at latest yet,
+        gas_price: the exchange's gas price in fri (see gas_price_of), the node's is read without it"""
+        accounts = list(dict.fromkeys(address_int(p.account) for p in plans))
+        balances = {address_int(account): b for account, b in balances.items()}
+        requests = [] if gas_price else [('starknet_getBlockWithTxHashes', {'block_id': 'latest'})]
+        unknown = [a for a in accounts if self.indexer is None or self.indexer.signer_of(a) is None]
+        requests += [call_request(self.core_address, 'get_signer', [a]) for a in unknown]
+        pending_checks = [p for p in plans if p.action == ONCHAIN_WITHDRAW]
+        requests += [call_request(self.core_address, 'get_pending_withdraw',
+                                  [address_int(p.account), self.token_addresses[p.token]]) for p in pending_checks]
+        results = await self.rpc.request(requests)
+
+        if gas_price:
+            self.gas_price = gas_price
+        else:
+            block, results = results[0], results[1:]
+            if isinstance(block, RpcError):
+                raise block
+            logging.warning('Preflight has no exchange gas price, using the l1 gas price of the latest block')
+            self.gas_price = int(block['l1_gas_price']['price_in_fri'], 16)
+        signers, pending = results[:len(unknown)], results[len(unknown):]
+
+        unbound, assume_bound = set(), {address_int(a) for a in assume_bound}
+        for account, signer in zip(unknown, signers):
+            if isinstance(signer, RpcError):
+                logging.warning(f'Preflight could not read signer of {hex(account)}: {signer}')
+            elif not any(felts(signer)) and account not in assume_bound:
+                unbound.add(account)
+        for plan, result in zip(pending_checks, pending):
+            if not isinstance(result, RpcError) and any(felts(result)):
+                plan.pending = True
+                plan.reject('previous withdrawal not completed')
+
+        for account in accounts:
+            account_plans = [p for p in plans if address_int(p.account) == account and p.ok]
+            if account in unbound:
+                for plan in account_plans:
+                    if plan.action == WITHDRAW:
+                        plan.reject('signer not bound')
+                account_plans = [p for p in account_plans if p.ok]
+            if account_plans:
+                self._apply_fees(account_plans, balances.get(account, {}))
+        # the fee token goes last so it is withdrawn only after it paid for everything else
+        plans.sort(key=lambda p: p.token == p.fee_token)
+        return plans
+
+    def _apply_fees(self, plans: List[PlannedWithdrawal], balances: Dict[str, Decimal]):
+        available = {t: Decimal(str(b)) for t, b in balances.items()}
+        available.update({p.token: min(p.amount, available.get(p.token, p.amount)) for p in plans})
+        fee_plan = self.planner.plan(available, self.native_fee_per_action(plans[0].action), [p.token for p in plans])
+        if fee_plan.fee_token is None:
+            for plan in plans:
+                plan.reject(fee_plan.reason)
+            return
+        for plan in plans:
+            plan.fee_token = fee_plan.fee_token
+            if plan.token not in fee_plan.amounts:
+                plan.reject(fee_plan.kept.get(plan.token, 'nothing above reserve'))
+                continue
+            plan.fee = fee_plan.fee_per_action
+            plan.net_amount = fee_plan.amounts[plan.token]
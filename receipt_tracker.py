@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from rpc_batch import JsonRpcBatch
+
+ACCEPTED = ('ACCEPTED_ON_L2', 'ACCEPTED_ON_L1')
+
+
+class TransactionFailed(Exception):
+
+    def __init__(self, tx_hash: int, status: str, reason: str = ''):
+        super().__init__(f'{hex(tx_hash)} {status} {reason}'.strip())
+        self.tx_hash = tx_hash
+        self.status = status
+        self.reason = reason
+
+
+def tx_hash_of(result) -> Optional[int]:
+    """Best effort extraction of a transaction hash from whatever a request returned"""
+    if result is None or isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, str):
+        return int(result, 16) if result.startswith('0x') else None
+    for attr in ('transaction_hash', 'tx_hash', 'hash', 'data'):
+        if hasattr(result, attr):
+            return tx_hash_of(getattr(result, attr))
+    if isinstance(result, dict):
+        return tx_hash_of(result.get('transaction_hash'))
+    return None
+
+
+class ReceiptTracker:
+    """Tracks any number of transactions with a single poller.
+
+    track() returns a future that resolves with the finality status once the transaction is
+    accepted and raises TransactionFailed if it reverts or is rejected. All pending hashes are
+    checked in one starknet_getTransactionStatus batch per round; the interval drops back to
+    min_interval whenever something resolves and backs off to max_interval while nothing does."""
+
+    def __init__(self, rpc: JsonRpcBatch, min_interval: float = 1.0, max_interval: float = 15.0,
+                 timeout: float = 600.0, verbose=False):
+        self.rpc = rpc
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.verbose = verbose
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._deadlines: Dict[int, float] = {}
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    def track(self, tx_hash) -> asyncio.Future:
+        tx_hash = tx_hash if isinstance(tx_hash, int) else tx_hash_of(tx_hash)
+        if tx_hash in self._futures:
+            return self._futures[tx_hash]
+        future = asyncio.get_running_loop().create_future()
+        self._futures[tx_hash] = self._pending[tx_hash] = future
+        self._deadlines[tx_hash] = time.monotonic() + self.timeout
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        return future
+
+    def track_result(self, result) -> Optional[asyncio.Future]:
+        """Tracks the transaction behind a request result, None if it carries no hash"""
+        tx_hash = tx_hash_of(result)
+        return self.track(tx_hash) if tx_hash else None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def wait_all(self) -> Dict[int, object]:
+        """Waits for every tracked transaction, returns hash -> status or exception"""
+        hashes = list(self._futures)
+        results = await asyncio.gather(*self._futures.values(), return_exceptions=True)
+        return dict(zip(hashes, results))
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+    def _resolve(self, tx_hash: int, status: dict) -> bool:
+        finality, execution = status.get('finality_status'), status.get('execution_status')
+        future = self._pending[tx_hash]
+        if execution == 'REVERTED':
+            future.set_exception(TransactionFailed(tx_hash, execution, status.get('failure_reason', '')))
+        elif finality == 'REJECTED':
+            future.set_exception(TransactionFailed(tx_hash, finality))
+        elif finality in ACCEPTED:
+            future.set_result(finality)
+        else:
+            return False
+        return True
+
+    async def _poll(self):
+        interval = self.min_interval
+        while self._pending:
+            await asyncio.sleep(interval)
+            hashes = list(self._pending)
+            try:
+                statuses = await self.rpc.request([('starknet_getTransactionStatus', {'transaction_hash': hex(h)})
+                                                   for h in hashes])
+            except Exception as e:
+                logging.exception(e)
+                # an unreachable node must not keep the futures open past their deadline
+                statuses = [e] * len(hashes)
+            resolved, now = 0, time.monotonic()
+            for tx_hash, status in zip(hashes, statuses):
+                # not-yet-received transactions come back as RpcError (TXN_HASH_NOT_FOUND), keep polling
+                done = not isinstance(status, Exception) and self._resolve(tx_hash, status)
+                if not done and now > self._deadlines[tx_hash]:
+                    self._pending[tx_hash].set_exception(TransactionFailed(tx_hash, 'TIMEOUT', str(status)))
+                    done = True
+                if done:
+                    del self._pending[tx_hash], self._deadlines[tx_hash]
+                    resolved += 1
+            if self.verbose:
+                logging.info(f'Receipt poll: {resolved} resolved, {len(self._pending)} pending')
+            interval = self.min_interval if resolved else min(interval * 1.5, self.max_interval)
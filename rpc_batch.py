@@ -0,0 +1,85 @@
+import itertools
+import logging
+from typing import Any, List, Optional, Sequence, Tuple
+
+import aiohttp
+from starknet_py.hash.selector import get_selector_from_name
+
+
+class RpcError(Exception):
+
+    def __init__(self, method: str, error):
+        super().__init__(f'{method}: {error}')
+        self.error = error
+
+
+class JsonRpcBatch:
+    """Sends many Starknet JSON-RPC requests as batched HTTP POSTs (one round trip per batch).
+
+    Results come back in request order; a failed request yields an RpcError in its slot instead
+    of failing the whole batch."""
+
+    def __init__(self, node_url: str, session: Optional[aiohttp.ClientSession] = None, max_batch: int = 100,
+                 verbose=False):
+        self.node_url = node_url
+        self.max_batch = max_batch
+        self.verbose = verbose
+        self._session = session
+        self._own_session = session is None
+        self._ids = itertools.count()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, calls: Sequence[Tuple[str, Any]]) -> List[Any]:
+        results = []
+        for start in range(0, len(calls), self.max_batch):
+            results.extend(await self._send(calls[start:start + self.max_batch]))
+        return results
+
+    async def _send(self, calls: Sequence[Tuple[str, Any]]) -> List[Any]:
+        if not calls:
+            return []
+        ids = [next(self._ids) for _ in calls]
+        payload = [{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+                   for i, (method, params) in zip(ids, calls)]
+        session = await self._get_session()
+        async with session.post(self.node_url, json=payload) as resp:
+            body = await resp.json(content_type=None)
+        if isinstance(body, dict):  # whole batch rejected
+            raise RpcError('batch', body.get('error', body))
+        by_id = {item.get('id'): item for item in body}
+        out = []
+        for i, (method, _) in zip(ids, calls):
+            item = by_id.get(i, {'error': 'missing response'})
+            out.append(RpcError(method, item['error']) if 'error' in item else item['result'])
+        if self.verbose:
+            failed = sum(isinstance(r, RpcError) for r in out)
+            logging.info(f'JSON-RPC batch of {len(calls)} request(s), {failed} failed')
+        return out
+
+
+def address_int(address) -> int:
+    if hasattr(address, 'as_int'):
+        return address.as_int()
+    return int(address, 16) if isinstance(address, str) else int(address)
+
+
+def call_request(contract: int, function: str, calldata: Sequence[int], block_id='latest') -> Tuple[str, Any]:
+    """starknet_call request for JsonRpcBatch.request"""
+    return 'starknet_call', {
+        'request': {'contract_address': hex(contract), 'entry_point_selector': hex(get_selector_from_name(function)),
+                    'calldata': [hex(x) for x in calldata]},
+        'block_id': block_id,
+    }
+
+
+def felts(result) -> List[int]:
+    return [int(x, 16) for x in result] if isinstance(result, list) else []
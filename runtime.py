@@ -0,0 +1,154 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import os
+import signal
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+
+
+def _loop_factory(use_uvloop: Optional[bool]):
+    """uvloop's loop factory when it is installed and not disabled (AKIRA_UVLOOP=0), else None"""
+    if use_uvloop is None:
+        use_uvloop = os.environ.get('AKIRA_UVLOOP', '1') != '0'
+    if not use_uvloop:
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    return uvloop.new_event_loop
+
+
+async def close_quietly(obj):
+    """Closes a client: its close()/aclose() if it has one, otherwise any aiohttp sessions it holds"""
+    try:
+        for name in ('aclose', 'close'):
+            fn = getattr(obj, name, None)
+            if callable(fn):
+                result = fn()
+                if inspect.isawaitable(result):
+                    await result
+                return
+        for value in getattr(obj, '__dict__', {}).values():
+            if isinstance(value, aiohttp.ClientSession) and not value.closed:
+                await value.close()
+    except Exception as e:
+        logging.exception(e)
+
+
+class Runtime:
+    """Owns the event loop lifecycle of a script.
+
+    Clients register themselves for closing, background tasks are started with spawn(). When main
+    returns, or on SIGINT/SIGTERM, shutdown cancels background tasks, gives any other in-flight task
+    up to drain_timeout to finish and then closes registered clients in reverse order. The first
+    signal only sets `stopping` so loops can finish the request at hand; main is cancelled
+    after drain_timeout, or right away on a second signal."""
+
+    def __init__(self, drain_timeout: float = 10.0):
+        self.drain_timeout = drain_timeout
+        self.stopping = False
+        self._closers: List[Callable] = []
+        self._background: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session, closed on shutdown"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+            self.close_on_shutdown(self._session)
+        return self._session
+
+    def on_shutdown(self, closer: Callable):
+        self._closers.append(closer)
+        return closer
+
+    def close_on_shutdown(self, *clients):
+        for client in clients:
+            if client is not None:
+                self.on_shutdown(lambda c=client: close_quietly(c))
+
+    @contextlib.asynccontextmanager
+    async def scope(self):
+        """Closes whatever was registered inside the block on exit, e.g. per account in a long sweep"""
+        mark = len(self._closers)
+        try:
+            yield self
+        finally:
+            closers, self._closers[mark:] = self._closers[mark:], []
+            await self._close(closers)
+
+    async def _close(self, closers: List[Callable]):
+        while closers:
+            try:
+                result = closers.pop()()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.exception(e)
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._background.append(task)
+        return task
+
+    def _install_signals(self, main_task: asyncio.Task):
+        loop = asyncio.get_running_loop()
+
+        def on_signal(sig):
+            if self.stopping:
+                main_task.cancel()
+                return
+            self.stopping = True
+            print(f"\n{sig.name} received, finishing in-flight requests (again to abort)...")
+            loop.call_later(self.drain_timeout, main_task.cancel)
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, on_signal, sig)
+            except (NotImplementedError, RuntimeError):
+                pass  # e.g. Windows or not in the main thread
+
+    async def shutdown(self):
+        for task in self._background:
+            task.cancel()
+        current = asyncio.current_task()
+        in_flight = [t for t in asyncio.all_tasks() if t is not current and not t.done()]
+        if in_flight:
+            _, pending = await asyncio.wait(in_flight, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._background.clear()
+        await self._close(self._closers)
+
+    async def _main(self, main: Callable[[], Awaitable]):
+        task = asyncio.current_task()
+        self._install_signals(task)
+        try:
+            return await main()
+        except asyncio.CancelledError:
+            print("Cancelled")
+            if hasattr(task, 'uncancel'):
+                task.uncancel()
+        finally:
+            await self.shutdown()
+
+
+runtime = Runtime()
+
+
+def run(main: Callable[[], Awaitable], use_uvloop: Optional[bool] = None):
+    """Runs main() on a fresh event loop (uvloop when available) with signal handling and
+    deterministic shutdown; replaces asyncio.get_event_loop().run_until_complete(main())"""
+    factory = _loop_factory(use_uvloop)
+    if hasattr(asyncio, 'Runner'):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(runtime._main(main))
+    if factory is not None:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(runtime._main(main))
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+from account_source import AccountRecord, KeyBackend, key_backend, open_account_source, trading_account
+from preflight import WithdrawOutcome
+from receipt_tracker import ReceiptTracker
+from rpc_batch import JsonRpcBatch
+from runtime import run, runtime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY, job TEXT NOT NULL, account TEXT NOT NULL, payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT, lease_until REAL, heartbeat_at REAL, result TEXT, error TEXT, updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (job, status, lease_until);
+"""
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+class Task:
+    __slots__ = ('id', 'job', 'account', 'payload', 'attempts', 'worker')
+
+    def __init__(self, id, job, account, payload, attempts, worker):
+        self.id, self.job, self.account, self.payload = id, job, account, json.loads(payload)
+        self.attempts, self.worker = attempts, worker
+
+
+class WorkQueue:
+    """Durable SQLite work queue with leases.
+
+    A task is identified by (job, account) so enqueueing the same fleet twice is a no-op.
+    A claim leases the task to one worker until lease_until; workers heartbeat to extend it and
+    expired leases are handed out again. complete/fail only apply while the caller still holds
+    the claim (same worker and attempt), so a worker that lost its lease cannot overwrite the
+    result of the one that took over."""
+
+    def __init__(self, path: str = 'sweep_queue.sqlite', max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, job: str, accounts: Iterable[Dict], batch: int = 1000) -> int:
+        """accounts yields AccountRecord dicts, consumed lazily in batches; returns number of new tasks"""
+        added, rows = 0, []
+        for payload in accounts:
+            account = payload['account_address']
+            rows.append((f'{job}:{account}', job, account, json.dumps(payload), time.time()))
+            if len(rows) >= batch:
+                added += self._insert(rows)
+                rows = []
+        return added + self._insert(rows)
+
+    def _insert(self, rows) -> int:
+        if not rows:
+            return 0
+        before = self.db.total_changes
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.executemany('INSERT OR IGNORE INTO tasks (id, job, account, payload, updated_at) '
+                            'VALUES (?, ?, ?, ?, ?)', rows)
+        self.db.execute('COMMIT')
+        return self.db.total_changes - before
+
+    def claim(self, job: str, worker: str, lease_seconds: float) -> Optional[Task]:
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute('UPDATE tasks SET status = ?, error = COALESCE(error, ?), updated_at = ? '
+                            'WHERE job = ? AND status = ? AND lease_until < ? AND attempts >= ?',
+                            (FAILED, 'lease expired', now, job, LEASED, now, self.max_attempts))
+            row = self.db.execute(
+                'SELECT id, job, account, payload, attempts FROM tasks WHERE job = ? AND attempts < ? AND '
+                '(status = ? OR (status = ? AND lease_until < ?)) LIMIT 1',
+                (job, self.max_attempts, PENDING, LEASED, now)).fetchone()
+            if row is None:
+                self.db.execute('COMMIT')
+                return None
+            self.db.execute('UPDATE tasks SET status = ?, worker = ?, attempts = attempts + 1, lease_until = ?, '
+                            'heartbeat_at = ?, updated_at = ? WHERE id = ?',
+                            (LEASED, worker, now + lease_seconds, now, now, row[0]))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return Task(*row[:4], row[4] + 1, worker)
+
+    def _owned_update(self, task: Task, assignments: str, params) -> bool:
+        cur = self.db.execute(f'UPDATE tasks SET {assignments}, updated_at = ? '
+                              f'WHERE id = ? AND worker = ? AND attempts = ? AND status = ?',
+                              (*params, time.time(), task.id, task.worker, task.attempts, LEASED))
+        return cur.rowcount == 1
+
+    def heartbeat(self, task: Task, lease_seconds: float) -> bool:
+        now = time.time()
+        return self._owned_update(task, 'lease_until = ?, heartbeat_at = ?', (now + lease_seconds, now))
+
+    def complete(self, task: Task, result=None) -> bool:
+        return self._owned_update(task, 'status = ?, result = ?', (DONE, json.dumps(result)))
+
+    def fail(self, task: Task, error: str, result=None) -> bool:
+        # back to pending while attempts remain, claim() skips it once max_attempts is reached
+        status = PENDING if task.attempts < self.max_attempts else FAILED
+        return self._owned_update(task, 'status = ?, error = ?, result = ?, lease_until = NULL',
+                                  (status, error, json.dumps(result)))
+
+    def progress(self, job: str) -> Dict[str, int]:
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, count in self.db.execute('SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status',
+                                             (job,)):
+            counts[status] = count
+        return counts
+
+    def failures(self, job: str):
+        return self.db.execute('SELECT account, attempts, error FROM tasks WHERE job = ? AND status = ?',
+                               (job, FAILED)).fetchall()
+
+    def summary(self, job: str) -> Dict[str, Dict[str, int]]:
+        """Per token counts of submitted / skipped / failed withdrawals over the job's finished tasks"""
+        totals: Dict[str, Dict[str, int]] = {}
+        for (result,) in self.db.execute('SELECT result FROM tasks WHERE job = ? AND status IN (?, ?)',
+                                         (job, DONE, FAILED)):
+            for kind, tokens in (json.loads(result or 'null') or {}).items():
+                if kind in ('submitted', 'skipped', 'failed'):
+                    for token in tokens:
+                        counts = totals.setdefault(token, {'submitted': 0, 'skipped': 0, 'failed': 0})
+                        counts[kind] += 1
+        return totals
+
+
+def make_client(config_file: str, mode: str):
+    """Parses the config once per worker, sweep_account only swaps the trading account"""
+    if mode == 'onchain':
+        from onchain_withdraw import OnChainWithdrawClient
+        return OnChainWithdrawClient(config_file)
+    from withdraw import WithdrawClient
+    return WithdrawClient(config_file)
+
+
+async def sweep_account(client, mode: str, account: AccountRecord, keys: KeyBackend,
+                        index_db: Optional[str], tracker: ReceiptTracker) -> WithdrawOutcome:
+    """Submits the account's withdrawals; its transactions are left on tracker, settle the outcome to
+    wait for them"""
+    from LayerAkira.src.hasher.Hasher import AppDomain
+
+    client.cli_cfg.trading_account = trading_account(account, keys)
+    domain = AppDomain(client.cli_cfg.chain_id.value)
+    # clients opened for this account are closed as soon as it is done, not when the worker exits
+    async with runtime.scope():
+        if mode == 'onchain':
+            return await client.check_and_withdraw_onchain_balances(domain, index_db, assume_yes=True,
+                                                                    tracker=tracker)
+        return await client.withdraw_all_funds(domain, index_db, tracker=tracker)
+
+
+async def worker_loop(queue_path: str, job: str, config_file: str, mode: str, worker: str,
+                      lease_seconds: float = 300, index_db: Optional[str] = None, keys: KeyBackend = None):
+    queue = WorkQueue(queue_path)
+    keys = keys or key_backend('env')
+
+    async def keep_alive(task: Task, sweep: asyncio.Task) -> bool:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not queue.heartbeat(task, lease_seconds):
+                # someone else may already be sweeping this account, stop before submitting more
+                logging.warning(f'{worker} lost lease on {task.id}, cancelling its sweep')
+                sweep.cancel()
+                return True
+
+    def finish(task: Task, outcome: WithdrawOutcome, started: float):
+        result = {'seconds': round(time.time() - started, 3), 'worker': worker, **outcome.to_dict()}
+        if outcome.ok:
+            queue.complete(task, result)
+        else:
+            failed = {**outcome.failed, **{tx: s for tx, s in outcome.transactions.items()
+                                           if s.startswith('failed')}}
+            queue.fail(task, '; '.join(f'{k}: {v}' for k, v in failed.items()), result)
+
+    async def settle(task: Task, outcome: WithdrawOutcome, started: float, heartbeat: asyncio.Task):
+        # the lease is kept until the receipts are in, a worker dying meanwhile hands the account on
+        try:
+            finish(task, await outcome.settle(), started)
+        except Exception as e:
+            logging.exception(e)
+            queue.fail(task, str(e))
+        finally:
+            heartbeat.cancel()
+
+    settling = set()
+    tracker = None
+    try:
+        client = make_client(config_file, mode)
+        # one tracker for the worker's lifetime polls the transactions of every account it swept
+        tracker = ReceiptTracker(JsonRpcBatch(client.cli_cfg.node, runtime.session(),
+                                              verbose=client.cli_cfg.verbose), verbose=client.cli_cfg.verbose)
+        while not runtime.stopping:
+            task = queue.claim(job, worker, lease_seconds)
+            if task is None:
+                # tasks leased by a worker that died come back once their lease expires,
+                # this worker's own leases are released as their receipts settle
+                if queue.progress(job)[LEASED] == 0:
+                    break
+                await asyncio.sleep(min(lease_seconds / 3, 5))
+                continue
+            logging.info(f'{worker} claimed {task.id} (attempt {task.attempts})')
+            started = time.time()
+            sweep = asyncio.create_task(
+                sweep_account(client, mode, AccountRecord.from_dict(task.payload), keys, index_db, tracker))
+            heartbeat = asyncio.create_task(keep_alive(task, sweep))
+            try:
+                outcome = await sweep
+            except asyncio.CancelledError:
+                lost = heartbeat.done() and not heartbeat.cancelled() and heartbeat.result()
+                heartbeat.cancel()
+                if not lost:
+                    raise
+                # lease lost: the task now belongs to whoever claims it next, leave its row alone
+                continue
+            except Exception as e:
+                heartbeat.cancel()
+                logging.exception(e)
+                queue.fail(task, str(e))
+                continue
+            pending = asyncio.create_task(settle(task, outcome, started, heartbeat))
+            settling.add(pending)
+            pending.add_done_callback(settling.discard)
+        if settling:
+            await asyncio.wait(settling)
+    finally:
+        # on an abort unsettled tasks keep their lease until it expires and are swept again
+        for pending in list(settling):
+            pending.cancel()
+        await asyncio.gather(*settling, return_exceptions=True)
+        if tracker is not None:
+            await tracker.close()
+        queue.close()
+
+
+def _worker_process(queue_path, job, config_file, mode, worker, lease_seconds, index_db, log_dir, keys):
+    os.makedirs(log_dir, exist_ok=True)
+    sys.stdout = open(os.path.join(log_dir, f'{worker}.log'), 'a', buffering=1)
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO,
+                        filename=os.path.join(log_dir, f'{worker}.log'))
+    run(lambda: worker_loop(queue_path, job, config_file, mode, worker, lease_seconds, index_db, keys))
+
+
+def print_summary(queue: WorkQueue, job: str):
+    for token, counts in sorted(queue.summary(job).items()):
+        print(f"{token}: {counts['submitted']} submitted, {counts['skipped']} skipped, {counts['failed']} failed")
+    for account, attempts, error in queue.failures(job):
+        print(f"❌ {account} failed after {attempts} attempt(s): {error}")
+
+
+def sync_index(config_file: str, db_path: str):
+    """Brings the chain_indexer.py database up to date once, before workers read signers from it"""
+    from LayerAkira.src.CLIClient import CLIClient
+    from chain_indexer import indexer_from_config
+
+    async def sync():
+        indexer = indexer_from_config(CLIClient(config_file).cli_cfg, db_path)
+        try:
+            print(f"Indexed {await indexer.sync()} new events into {db_path}")
+        finally:
+            indexer.close()
+
+    run(sync)
+
+
+def run_workers(args, count: int):
+    if args.index_db:
+        sync_index(args.toml_config_file, args.index_db)
+    host = socket.gethostname()
+    ctx = multiprocessing.get_context('spawn')
+    procs = [ctx.Process(target=_worker_process,
+                         args=(args.queue, args.job, args.toml_config_file, args.mode,
+                               f'{host}-{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}', args.lease_seconds,
+                               args.index_db, args.log_dir, key_backend(args.key_backend, args.keystore_dir)))
+             for i in range(count)]
+    for p in procs:
+        p.start()
+    queue = WorkQueue(args.queue)
+    try:
+        while any(p.is_alive() for p in procs):
+            print(f"\r{queue.progress(args.job)}", end='', flush=True)
+            time.sleep(2)
+        print(f"\r{queue.progress(args.job)}")
+        print_summary(queue, args.job)
+    finally:
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='SweepCoordinator',
+                                     description='Distribute withdrawal sweeps across worker processes')
+    parser.add_argument('--queue', default='sweep_queue.sqlite', help='work queue database')
+    parser.add_argument('--job', default='sweep', help='job name, tasks are unique per (job, account)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    enqueue = sub.add_parser('enqueue', help='add accounts (.csv, .jsonl or .sqlite) to the job')
+    enqueue.add_argument('accounts_file')
+    for name in ('run', 'work'):
+        p = sub.add_parser(name, help='spawn local workers and report progress' if name == 'run'
+                           else 'run a single local worker next to a running job')
+        p.add_argument('--toml_config_file', default='config.toml')
+        p.add_argument('--mode', choices=['exchange', 'onchain'], default='exchange')
+        p.add_argument('--lease_seconds', type=float, default=300)
+        p.add_argument('--index_db')
+        p.add_argument('--log_dir', default='sweep_logs')
+        p.add_argument('--key_backend', choices=['env', 'keystore'], default='env')
+        p.add_argument('--keystore_dir', default='keystore')
+        if name == 'run':
+            p.add_argument('--workers', type=int, default=os.cpu_count())
+    sub.add_parser('status', help='print job progress')
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        queue = WorkQueue(args.queue)
+        accounts = (account.to_dict() for account in open_account_source(args.accounts_file))
+        print(f"Enqueued {queue.enqueue(args.job, accounts)} new task(s)")
+        print(queue.progress(args.job))
+        queue.close()
+    elif args.command == 'run':
+        run_workers(args, args.workers)
+    elif args.command == 'work':
+        run_workers(args, 1)
+    elif args.command == 'status':
+        queue = WorkQueue(args.queue)
+        print(queue.progress(args.job))
+        print_summary(queue, args.job)
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import argparse
-import asyncio
 import logging
 
 from LayerAkira.src.CLIClient import CLIClient
 from LayerAkira.src.hasher.Hasher import AppDomain
 
+from runtime import run
+
 
 async def main():
     parser = argparse.ArgumentParser(prog='WithdrawScript',
@@ -19,4 +20,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.get_event_loop().run_until_complete(main())
+    run(main)
@@ -0,0 +1,82 @@
+import json
+import sqlite3
+
+import pytest
+from eth_keyfile import create_keyfile_json
+
+from account_source import (AccountRecord, AccountSource, CsvAccountSource, EnvKeyBackend, JsonlAccountSource,
+                            KeyBackend, KeystoreKeyBackend, SqliteAccountSource, key_backend, open_account_source)
+
+
+def records(source):
+    return [(r.address, r.public_key, r.key_ref) for r in source]
+
+
+def test_csv_source_with_optional_key_ref(tmp_path):
+    path = tmp_path / 'accounts.csv'
+    path.write_text('account_address,public_key,key_ref\n0xa,0x1,KEY_A\n0xb,0x2,\n')
+    assert records(open_account_source(str(path))) == [('0xa', '0x1', 'KEY_A'), ('0xb', '0x2', None)]
+    assert isinstance(open_account_source(str(path)), CsvAccountSource)
+
+
+def test_jsonl_source_skips_blank_lines(tmp_path):
+    path = tmp_path / 'accounts.jsonl'
+    path.write_text(json.dumps({'account_address': '0xa', 'public_key': '0x1'}) + '\n\n'
+                    + json.dumps({'account_address': '0xb', 'public_key': '0x2', 'key_ref': 'b.json'}) + '\n')
+    assert isinstance(open_account_source(str(path)), JsonlAccountSource)
+    assert records(open_account_source(str(path))) == [('0xa', '0x1', None), ('0xb', '0x2', 'b.json')]
+
+
+@pytest.mark.parametrize('with_key_ref', [True, False])
+def test_sqlite_source_reads_in_batches(tmp_path, with_key_ref):
+    path = str(tmp_path / 'accounts.sqlite')
+    db = sqlite3.connect(path)
+    if with_key_ref:
+        db.execute('CREATE TABLE accounts (account_address TEXT, public_key TEXT, key_ref TEXT)')
+        db.executemany('INSERT INTO accounts VALUES (?, ?, ?)', [(f'0x{i}', '0x1', f'K{i}') for i in range(5)])
+    else:
+        db.execute('CREATE TABLE accounts (account_address TEXT, public_key TEXT)')
+        db.executemany('INSERT INTO accounts VALUES (?, ?)', [(f'0x{i}', '0x1') for i in range(5)])
+    db.commit()
+    db.close()
+    source = SqliteAccountSource(path, batch=2)
+    assert records(source) == [(f'0x{i}', '0x1', f'K{i}' if with_key_ref else None) for i in range(5)]
+    assert isinstance(open_account_source(path), SqliteAccountSource)
+
+
+def test_unknown_extension_is_rejected():
+    with pytest.raises(Exception, match='Unsupported account source'):
+        open_account_source('accounts.xlsx')
+
+
+def test_bases_are_abstract():
+    with pytest.raises(TypeError):
+        AccountSource('accounts.csv')
+    with pytest.raises(TypeError):
+        KeyBackend()
+
+
+def test_record_round_trips_through_the_queue_payload():
+    record = AccountRecord('0xa', '0x1', 'KEY_A')
+    assert records([AccountRecord.from_dict(record.to_dict())]) == [('0xa', '0x1', 'KEY_A')]
+    assert AccountRecord('0xa', '0x1').to_dict() == {'account_address': '0xa', 'public_key': '0x1'}
+
+
+def test_env_backend_uses_key_ref_or_the_address(monkeypatch):
+    monkeypatch.setenv('KEY_A', '0x11')
+    monkeypatch.setenv('AKIRA_PK_0xb', '0x22')
+    keys = key_backend('env')
+    assert isinstance(keys, EnvKeyBackend)
+    assert keys.private_key(AccountRecord('0xa', '0x1', 'KEY_A')) == '0x11'
+    assert keys.private_key(AccountRecord('0xb', '0x2')) == '0x22'
+    with pytest.raises(Exception, match='set AKIRA_PK_0xc'):
+        keys.private_key(AccountRecord('0xc', '0x3'))
+
+
+def test_keystore_backend_decrypts_the_account_file(tmp_path):
+    keystore = create_keyfile_json((0x1234).to_bytes(32, 'big'), b'secret', iterations=2)
+    (tmp_path / '0xa.json').write_text(json.dumps(keystore))
+    keys = key_backend('keystore', str(tmp_path))
+    assert isinstance(keys, KeystoreKeyBackend)
+    keys.password = 'secret'
+    assert keys.private_key(AccountRecord('0xa', '0x1')) == '0x1234'
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from balance_history import BalanceHistory
+from portfolio_valuation import PortfolioValuation
+
+
+def test_append_and_read_back_snapshot(tmp_path):
+    history = BalanceHistory(str(tmp_path))
+    assert history.append([('0xa', 'ETH', 1.0, 0.5, 0.0, 3), ('0xa', 'USDC', 0, 0, 0, 3)], ts=10) == 0
+    assert len(history) == 1
+    snap = history.snapshot()
+    assert len(snap['account']) == 1  # zero rows are not stored
+    assert snap['balance'].tolist() == [1.0] and snap['locked'].tolist() == [0.5]
+    assert [history.accounts[c] for c in history.coverage()] == ['0xa']
+    assert history.nonces().tolist() == [3]
+
+
+def test_diff_ignores_accounts_a_snapshot_did_not_cover(tmp_path):
+    history = BalanceHistory(str(tmp_path))
+    history.append([('A', 'STRK', 5, 0, 0, 1)], ts=1)
+    history.append([('B', 'STRK', 3, 0, 0, 1)], ts=2)
+    assert history.diff() == [('B', 'STRK', (0.0, 0.0, 0.0), (3.0, 0.0, 0.0))]
+    assert history.diff(0, 1) == []
+    assert history.holders() == ['A', 'B']
+    assert history.holders(-1) == ['B']
+
+    history.append([], ts=3, accounts=['A'])  # A drained
+    assert history.diff() == [('A', 'STRK', (5.0, 0.0, 0.0), (0.0, 0.0, 0.0))]
+    assert history.diff(0, 2) == history.diff()
+    assert history.holders() == ['B']
+    assert history.holders(min_amount=1, token='STRK') == ['B']
+    assert history.holders(token='ETH') == []
+
+
+def test_nonce_is_kept_for_accounts_without_funds(tmp_path):
+    history = BalanceHistory(str(tmp_path))
+    history.append([], ts=1, accounts=['A'], nonces={'A': 4})
+    history.append([], ts=2, accounts=['A'], nonces={'A': 5})
+    assert history.diff() == []
+    assert history.nonce_diff() == [('A', 4, 5)]
+    assert history.changed_accounts() == ['A']
+
+
+def test_append_valuation_covers_every_valued_account(tmp_path):
+    valuation = PortfolioValuation(['ETH'], {'ETH': 18})
+    valuation.add_account('0x1', free={'ETH': '2'})
+    valuation.add_account('0x2')
+    history = BalanceHistory(str(tmp_path))
+    history.append_valuation(valuation, {'0x1': 7, '0x2': 9}, ts=1)
+    assert sorted(history.accounts[c] for c in history.coverage()) == ['0x1', '0x2']
+    assert sorted(history.nonces().tolist()) == [7, 9]
+
+
+def test_reopen_truncates_rows_of_an_interrupted_append(tmp_path):
+    history = BalanceHistory(str(tmp_path))
+    history.append([('A', 'ETH', 1, 0, 0, 1)], ts=1)
+    with open(os.path.join(str(tmp_path), 'balance.bin'), 'ab') as f:
+        np.asarray([9.0], dtype=np.float64).tofile(f)  # row written, index never was
+    reopened = BalanceHistory(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.snapshot()['balance'].tolist() == [1.0]
@@ -0,0 +1,57 @@
+import sqlite3
+
+from starknet_py.hash.selector import get_selector_from_name
+
+from chain_indexer import ChainIndexer
+
+CORE, EXECUTOR = 0xc0, 0xe0
+
+
+class Event:
+    def __init__(self, name, keys, data, tx_hash=1, block=10):
+        self.keys = [get_selector_from_name(name)] + keys
+        self.data = data
+        self.transaction_hash = tx_hash
+        self.block_number = block
+
+
+def apply(indexer, contract, events):
+    with indexer.db:
+        return indexer._apply(contract, events)
+
+
+def test_events_of_two_contracts_in_one_tx_are_both_kept(tmp_path):
+    indexer = ChainIndexer(None, [CORE, EXECUTOR], str(tmp_path / 'index.sqlite'))
+    assert apply(indexer, CORE, [Event('Deposit', [0x5, 0x6], [0x7, 100, 0])]) == 1
+    assert apply(indexer, EXECUTOR, [Event('NewBinding', [0x5], [0x9])]) == 1
+    assert indexer.signer_of('0x5') == '0x9'
+    assert indexer.holders() == [('0x5', '0x6', 100)]
+    # re-applying after a crash before the checkpoint is a no-op
+    assert apply(indexer, CORE, [Event('Deposit', [0x5, 0x6], [0x7, 100, 0])]) == 0
+    assert indexer.holders() == [('0x5', '0x6', 100)]
+
+
+def test_pending_withdrawal_clears_on_withdrawal(tmp_path):
+    indexer = ChainIndexer(None, [CORE], str(tmp_path / 'index.sqlite'))
+    apply(indexer, CORE, [Event('Deposit', [0x5, 0x6], [0x7, 100, 0]),
+                          Event('ReqOnChainWithdrawal', [0x5], [0x5, 0x6, 40, 0])])
+    assert indexer.pending_withdrawals() == [('0x5', '0x6', 40)]
+    apply(indexer, CORE, [Event('Withdrawal', [0x5], [0x6, 40, 0], tx_hash=2)])
+    assert indexer.pending_withdrawals() == []
+    assert indexer.holders() == [('0x5', '0x6', 60)]
+
+
+def test_old_primary_key_is_migrated(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    db = sqlite3.connect(path)
+    db.executescript("""CREATE TABLE events (
+        tx_hash TEXT NOT NULL, event_idx INTEGER NOT NULL, block INTEGER NOT NULL, contract TEXT NOT NULL,
+        name TEXT NOT NULL, account TEXT, token TEXT, amount TEXT, PRIMARY KEY (tx_hash, event_idx));
+        INSERT INTO events VALUES ('0x1', 0, 10, '0xc0', 'Deposit', '0x5', '0x6', '100');""")
+    db.commit()
+    db.close()
+    indexer = ChainIndexer(None, [CORE, EXECUTOR], path)
+    pk = [row[1] for row in indexer.db.execute('PRAGMA table_info(events)') if row[5]]
+    assert set(pk) == {'tx_hash', 'contract', 'event_idx'}
+    assert indexer.db.execute('SELECT COUNT(*) FROM events').fetchone() == (1,)
+    assert apply(indexer, EXECUTOR, [Event('NewBinding', [0x5], [0x9])]) == 1
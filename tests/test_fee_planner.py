@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from fee_planner import FeePlanner
+
+DECIMALS = {'ETH': 18, 'STRK': 18, 'USDC': 6}
+FEE = 10 ** 17  # 0.1 STRK per withdrawal
+
+
+def planner(**kwargs):
+    return FeePlanner(DECIMALS, reserves={'STRK': Decimal(1)}, **kwargs)
+
+
+def test_fee_token_pays_for_all_withdrawals_and_keeps_its_reserve():
+    plan = planner().plan({'STRK': 5, 'ETH': '0.5', 'USDC': 20}, FEE)
+    assert plan.fee_token == 'STRK' and plan.fee_per_action == Decimal('0.1')
+    assert plan.total_fee == Decimal('0.3')
+    assert plan.amounts == {'ETH': Decimal('0.5'), 'USDC': Decimal(20), 'STRK': Decimal('3.7')}
+    assert plan.kept == {}
+
+
+def test_fee_token_dust_is_not_withdrawn():
+    plan = planner().plan({'STRK': 1.2000000000000001, 'ETH': 0.1}, FEE)
+    assert plan.amounts == {'ETH': Decimal('0.1')}
+    assert plan.total_fee == Decimal('0.1')
+    assert 'below the minimum withdrawal 0.1' in plan.kept['STRK']
+
+
+def test_fee_token_withdrawn_once_it_pays_for_itself():
+    assert planner().plan({'STRK': '1.3', 'ETH': 1}, FEE).amounts['STRK'] == Decimal('0.1')
+    assert 'STRK' not in planner(min_amounts={'STRK': 1}).plan({'STRK': '1.3', 'ETH': 1}, FEE).amounts
+
+
+def test_min_amounts_keep_small_balances_of_other_tokens():
+    plan = planner(min_amounts={'USDC': 1}).plan({'STRK': 2, 'USDC': '0.5', 'ETH': 1}, FEE)
+    assert set(plan.amounts) == {'ETH', 'STRK'}
+    assert plan.kept['USDC'] == '0.5 is below the minimum withdrawal 1'
+    assert plan.amounts['STRK'] == Decimal('0.8')
+
+
+def test_not_enough_fee_token_for_gas():
+    plan = planner().plan({'STRK': '1.05', 'ETH': 1}, FEE)
+    assert plan.fee_token is None
+    assert plan.reason.startswith('not enough STRK for gas: need 0.1')
+
+
+def test_only_requested_tokens_are_planned():
+    plan = planner().plan({'STRK': 3, 'ETH': 1, 'USDC': 5}, FEE, withdraw_tokens=['ETH'])
+    assert plan.amounts == {'ETH': Decimal(1)}
+    assert plan.total_fee == Decimal('0.1') and plan.kept == {}
+    assert planner().plan({'STRK': 1, 'ETH': 0}, FEE).kept == {'ETH': 'nothing above reserve',
+                                                               'STRK': 'nothing above reserve'}
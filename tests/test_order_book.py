@@ -0,0 +1,45 @@
+import asyncio
+
+from order_book import LocalOrderBook, OrderBookManager
+
+
+def test_snapshot_replaces_both_sides_and_sorts_best_levels():
+    book = LocalOrderBook(('ETH', 'USDC'))
+    book.apply_snapshot([(99, 2), (100, 1), (98, 0)], [(102, 4), (101, 3)], 1)
+    assert book.synced
+    assert book.best_bid() == (100, 1)
+    assert book.best_ask() == (101, 3)
+    assert book.depth(5) == {'bids': [(100, 1), (99, 2)], 'asks': [(101, 3), (102, 4)]}
+
+    book.apply_snapshot([(90, 1)], [], 2)
+    assert book.depth(5) == {'bids': [(90, 1)], 'asks': []}
+
+
+def test_stale_and_duplicated_snapshots_are_ignored():
+    book = LocalOrderBook(('ETH', 'USDC'))
+    book.apply_snapshot([(100, 1)], [], 5)
+    book.apply_snapshot([(1, 1)], [], 5)
+    book.apply_snapshot([(2, 1)], [], 3)
+    assert book.best_bid() == (100, 1)
+    assert book.seq == 5
+
+
+def test_snapshot_without_seq_keeps_last_known_seq():
+    book = LocalOrderBook(('ETH', 'USDC'))
+    book.apply_snapshot([(100, 1)], [], 5)
+    book.apply_snapshot([(101, 1)], [], None)
+    assert book.seq == 5
+    book.apply_snapshot([(1, 1)], [], 3)
+    assert book.best_bid() == (101, 1)
+
+
+def test_manager_consumer_reads_dict_levels_from_result_payload():
+    manager = OrderBookManager()
+    assert manager.get('ETH', 'USDC') is None
+    consume = manager.consumer('ETH', 'USDC')
+    asyncio.run(consume({'result': {'bids': [{'price': 100, 'volume': 2}], 'asks': [{'px': 101, 'qty': 1}],
+                                    'msg_id': 7}}))
+    book = manager.get('ETH', 'USDC')
+    assert book.best_bid() == (100, 2)
+    assert book.best_ask() == (101, 1)
+    assert book.seq == 7
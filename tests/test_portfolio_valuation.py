@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from portfolio_valuation import FREE, ONCHAIN, PortfolioValuation, parse_quotes
+
+
+def test_parse_quotes():
+    assert parse_quotes(['ETH=2500', ' STRK = 0.45']) == {'ETH': 2500.0, 'STRK': 0.45}
+    assert parse_quotes(None) == {}
+
+
+def test_matrix_combines_free_locked_and_onchain_base_units():
+    valuation = PortfolioValuation(['ETH', 'USDC'], {'ETH': 18, 'USDC': 6}, capacity=1)
+    valuation.add_user_info('0x1', {'ETH': ('1.5', '0.5'), 'USDC': ('0', '0')}, {'USDC': 2_000_000})
+    valuation.add_account('0x2', free={'USDC': '10', 'UNKNOWN': '5'})
+    assert len(valuation) == 2
+    assert np.allclose(valuation.matrix(), [[2.0, 2.0], [0.0, 10.0]])
+    assert np.allclose(valuation.matrix((FREE,)), [[1.5, 0.0], [0.0, 10.0]])
+    assert np.allclose(valuation.matrix((ONCHAIN,)), [[0.0, 2.0], [0.0, 0.0]])
+
+
+def test_value_totals_threshold_and_unpriced_tokens():
+    valuation = PortfolioValuation(['ETH', 'USDC', 'STRK'], {'ETH': 18, 'USDC': 6, 'STRK': 18})
+    valuation.add_account('0x1', free={'ETH': '1', 'STRK': '3'})
+    valuation.add_account('0x2', free={'USDC': '5'})
+    report = valuation.value({'ETH': 2000, 'USDC': 1}, threshold=100)
+    assert report.total == pytest.approx(2005)
+    assert report.accounts_above_threshold() == ['0x1']
+    assert report.unpriced == ['STRK']
+
+
+def test_onchain_amounts_without_decimals_fail_loudly():
+    valuation = PortfolioValuation(['ETH', 'NEW'], {'ETH': 18})
+    valuation.add_account('0x1', free={'NEW': '1'})
+    with pytest.raises(Exception, match='NEW'):
+        valuation.add_account('0x2', onchain_raw={'NEW': 10 ** 18})
+    assert valuation.accounts == ['0x1']
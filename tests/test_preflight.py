@@ -0,0 +1,63 @@
+import asyncio
+from decimal import Decimal
+
+from preflight import PlannedWithdrawal, WithdrawPreflight, gas_price_of
+from rpc_batch import RpcError
+
+STEPS = {'withdraw': {True: 100}}
+DECIMALS = {'ETH': 18, 'STRK': 18}
+
+
+class Rpc:
+    def __init__(self, signer='0x9', block_price=None):
+        self.signer, self.block_price, self.calls = signer, block_price, []
+
+    async def request(self, calls):
+        self.calls.extend(method for method, _ in calls)
+        results = []
+        for method, _ in calls:
+            if method == 'starknet_getBlockWithTxHashes':
+                results.append({'l1_gas_price': {'price_in_fri': hex(self.block_price)}})
+            else:
+                results.append(RpcError(method, 'down') if self.signer is None else [self.signer])
+        return results
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+def plans():
+    return [PlannedWithdrawal('0x5', 'STRK', Decimal(5)), PlannedWithdrawal('0x5', 'ETH', Decimal(1))]
+
+
+def test_gas_price_of_reads_query_gas_price_results():
+    assert gas_price_of(Result(10 ** 9)) == 10 ** 9
+    assert gas_price_of(10 ** 9) == 10 ** 9
+    assert gas_price_of(Result(None)) is None and gas_price_of(None) is None and gas_price_of(True) is None
+
+
+def test_exchange_gas_price_replaces_the_block_read():
+    rpc = Rpc()
+    preflight = WithdrawPreflight(rpc, 0xc0, {'ETH': 0xe, 'STRK': 0x5}, DECIMALS, STEPS)
+    result = asyncio.run(preflight.run(plans(), {'0x5': {'ETH': 1, 'STRK': 5}}, gas_price=10 ** 9))
+    assert rpc.calls == ['starknet_call']
+    assert [(p.token, p.ok) for p in result] == [('ETH', True), ('STRK', True)]
+    # 100 steps at 1 gwei-fri per withdrawal, STRK pays for both
+    assert result[1].net_amount == Decimal(5) - 2 * Decimal('1e-7')
+
+
+def test_falls_back_to_the_block_gas_price():
+    rpc = Rpc(block_price=2 * 10 ** 9)
+    preflight = WithdrawPreflight(rpc, 0xc0, {'ETH': 0xe, 'STRK': 0x5}, DECIMALS, STEPS)
+    result = asyncio.run(preflight.run(plans(), {'0x5': {'ETH': 1, 'STRK': 5}}))
+    assert rpc.calls == ['starknet_getBlockWithTxHashes', 'starknet_call']
+    assert preflight.gas_price == 2 * 10 ** 9
+    assert result[1].net_amount == Decimal(5) - 2 * Decimal('2e-7')
+
+
+def test_unbound_signer_rejects_exchange_withdrawals():
+    preflight = WithdrawPreflight(Rpc(signer='0x0'), 0xc0, {'ETH': 0xe, 'STRK': 0x5}, DECIMALS, STEPS)
+    result = asyncio.run(preflight.run(plans(), {'0x5': {'ETH': 1, 'STRK': 5}}, gas_price=10 ** 9))
+    assert {p.reason for p in result} == {'signer not bound'}
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from receipt_tracker import ReceiptTracker, TransactionFailed
+from rpc_batch import RpcError
+
+
+class Rpc:
+    def __init__(self, *rounds):
+        self.rounds = list(rounds)
+
+    async def request(self, calls):
+        result = self.rounds.pop(0) if len(self.rounds) > 1 else self.rounds[0]
+        if isinstance(result, Exception):
+            raise result
+        return result[:len(calls)]
+
+
+def test_resolves_accepted_and_reverted_in_one_batch():
+    async def main():
+        rpc = Rpc([RpcError('starknet_getTransactionStatus', 'TXN_HASH_NOT_FOUND')] * 2,
+                  [{'finality_status': 'ACCEPTED_ON_L2', 'execution_status': 'SUCCEEDED'},
+                   {'finality_status': 'ACCEPTED_ON_L2', 'execution_status': 'REVERTED'}])
+        tracker = ReceiptTracker(rpc, min_interval=0.01)
+        tracker.track(1), tracker.track(2)
+        return await tracker.wait_all()
+
+    results = asyncio.run(main())
+    assert results[1] == 'ACCEPTED_ON_L2'
+    assert isinstance(results[2], TransactionFailed) and results[2].status == 'REVERTED'
+
+
+def test_times_out_when_the_node_is_unreachable():
+    async def main():
+        tracker = ReceiptTracker(Rpc(ConnectionError('node down')), min_interval=0.01, max_interval=0.02,
+                                 timeout=0.05)
+        await asyncio.wait_for(tracker.track(1), 1)
+
+    with pytest.raises(TransactionFailed, match='TIMEOUT'):
+        asyncio.run(main())
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import sweep_coordinator
+from preflight import WithdrawOutcome
+from sweep_coordinator import DONE, FAILED, LEASED, PENDING, WorkQueue, worker_loop
+
+
+def accounts(*addresses):
+    return ({'account_address': a, 'public_key': '0x1'} for a in addresses)
+
+
+def test_enqueue_is_idempotent_per_job_and_account(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    assert queue.enqueue('job', accounts('0xa', '0xb'), batch=1) == 2
+    assert queue.enqueue('job', accounts('0xa', '0xb', '0xc')) == 1
+    assert queue.enqueue('other', accounts('0xa')) == 1
+    assert queue.progress('job') == {PENDING: 3, LEASED: 0, DONE: 0, FAILED: 0}
+
+
+def test_claim_leases_each_task_once(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.enqueue('job', accounts('0xa', '0xb'))
+    first, second = queue.claim('job', 'w1', 60), queue.claim('job', 'w2', 60)
+    assert {first.account, second.account} == {'0xa', '0xb'}
+    assert queue.claim('job', 'w3', 60) is None
+    assert queue.complete(first, {'submitted': {'ETH': '1'}})
+    assert queue.progress('job') == {PENDING: 0, LEASED: 1, DONE: 1, FAILED: 0}
+    assert queue.summary('job') == {'ETH': {'submitted': 1, 'skipped': 0, 'failed': 0}}
+
+
+def test_expired_lease_is_reissued_and_fences_the_old_worker(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.enqueue('job', accounts('0xa'))
+    stale = queue.claim('job', 'w1', 0)
+    time.sleep(0.01)
+    fresh = queue.claim('job', 'w2', 60)
+    assert fresh.account == '0xa' and fresh.attempts == 2
+    assert not queue.heartbeat(stale, 60)
+    assert not queue.complete(stale, {'worker': 'w1'})
+    assert queue.complete(fresh, {'worker': 'w2'})
+    assert queue.progress('job')[DONE] == 1
+
+
+def test_fail_retries_until_max_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=2)
+    queue.enqueue('job', accounts('0xa'))
+    assert queue.fail(queue.claim('job', 'w1', 60), 'boom')
+    assert queue.progress('job')[PENDING] == 1
+    assert queue.fail(queue.claim('job', 'w1', 60), 'boom again')
+    assert queue.claim('job', 'w1', 60) is None
+    assert queue.failures('job') == [('0xa', 2, 'boom again')]
+
+
+class Client:
+    class cli_cfg:
+        node, verbose = 'http://node', False
+
+
+def run_worker(monkeypatch, queue_path, sweep, lease_seconds):
+    monkeypatch.setattr(sweep_coordinator, 'make_client', lambda config_file, mode: Client())
+    monkeypatch.setattr(sweep_coordinator, 'sweep_account', sweep)
+    asyncio.run(worker_loop(queue_path, 'job', 'config.toml', 'exchange', 'w2', lease_seconds))
+
+
+async def sweep_ok(client, mode, account, keys, index_db, tracker):
+    return WithdrawOutcome()
+
+
+def test_worker_waits_for_leases_of_crashed_workers(tmp_path, monkeypatch):
+    path = str(tmp_path / 'queue.sqlite')
+    queue = WorkQueue(path)
+    queue.enqueue('job', accounts('0xa'))
+    queue.claim('job', 'crashed', 0.3)
+    run_worker(monkeypatch, path, sweep_ok, 0.3)
+    assert queue.progress('job') == {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 0}
+
+
+def test_lost_lease_cancels_the_sweep(tmp_path, monkeypatch):
+    path = str(tmp_path / 'queue.sqlite')
+    queue = WorkQueue(path)
+    queue.enqueue('job', accounts('0xa'))
+    cancelled = []
+
+    async def sweep_taken_over(client, mode, account, keys, index_db, tracker):
+        # another worker takes the task over and finishes it while this one is still sweeping
+        queue.db.execute('UPDATE tasks SET worker = ?, status = ?, result = ?', ('w3', DONE, '"theirs"'))
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(account.address)
+            raise
+        return WithdrawOutcome()
+
+    run_worker(monkeypatch, path, sweep_taken_over, 0.3)
+    assert cancelled == ['0xa']
+    assert queue.db.execute('SELECT worker, result FROM tasks').fetchall() == [('w3', '"theirs"')]
+
+
+def test_receipts_settle_in_the_background_before_the_task_is_done(tmp_path, monkeypatch):
+    path = str(tmp_path / 'queue.sqlite')
+    queue = WorkQueue(path)
+    queue.enqueue('job', accounts('0xa', '0xb'))
+    receipts, swept = {}, []
+
+    async def sweep_with_tx(client, mode, account, keys, index_db, tracker):
+        outcome = WithdrawOutcome()
+        swept.append(account.address)
+        if account.address in receipts:
+            return outcome  # the retry finds nothing left to withdraw
+        outcome.submit('ETH', 1)
+        outcome.receipts[len(swept)] = receipts[account.address] = asyncio.get_running_loop().create_future()
+        if len(receipts) == 2:
+            # both accounts were swept while the first one's transaction is still unconfirmed
+            assert queue.progress('job')[LEASED] == 2
+            receipts['0xa'].set_result('ACCEPTED_ON_L2')
+            receipts['0xb'].set_exception(Exception('REVERTED'))
+        return outcome
+
+    run_worker(monkeypatch, path, sweep_with_tx, 0.6)
+    assert sorted(swept) == ['0xa', '0xb', '0xb']
+    assert queue.progress('job') == {PENDING: 0, LEASED: 0, DONE: 2, FAILED: 0}
+    assert 'failed: REVERTED' in queue.db.execute('SELECT error FROM tasks WHERE account = ?', ('0xb',)).fetchone()[0]
@@ -4,13 +4,19 @@ import logging
 import sys
 import os
 from contextlib import contextmanager
+from decimal import Decimal
+from typing import Optional
 
 from LayerAkira.src.common.ContractAddress import ContractAddress
 from LayerAkira.src.hasher.Hasher import AppDomain
-from LayerAkira.src.common.ERC20Token import ERC20Token
-from LayerAkira.src.common.common import precise_to_price_convert
 
 from CustomCLIClient import CustomCLIClient
+from chain_indexer import ChainIndexer
+from fee_planner import FeePlanner
+from preflight import PlannedWithdrawal, WithdrawOutcome, WithdrawPreflight, gas_price_of
+from receipt_tracker import ReceiptTracker
+from rpc_batch import JsonRpcBatch
+from runtime import run, runtime
 
 
 @contextmanager
@@ -26,7 +32,7 @@ def suppress_stdout():
 
 class WithdrawClient(CustomCLIClient):
     
-    async def withdraw_all_funds(self, domain):
+    async def withdraw_all_funds(self, domain, index_db=None, tracker: Optional[ReceiptTracker] = None):
         from starknet_py.net.full_node_client import FullNodeClient
         from LayerAkira.src.AkiraExchangeClient import AkiraExchangeClient
         from LayerAkira.src.HttpClient import AsyncApiHttpClient
@@ -34,7 +40,7 @@ class WithdrawClient(CustomCLIClient):
         from LayerAkira.src.hasher.Hasher import SnTypedPedersenHasher
         from starknet_py.hash.utils import message_signature
         
-        node_client = FullNodeClient(node_url=self.cli_cfg.node)
+        node_client = FullNodeClient(node_url=self.cli_cfg.node, session=runtime.session())
         erc_to_addr = {token.symbol: token.address for token in self.cli_cfg.tokens}
         contract_client = AkiraExchangeClient(node_client,
                                               self.cli_cfg.core_address,
@@ -61,6 +67,34 @@ class WithdrawClient(CustomCLIClient):
                                                verbose=self.cli_cfg.verbose)
 
         await self.exchange_client.init()
+        runtime.close_on_shutdown(api_client)
+
+        # signer bindings already seen by chain_indexer.py spare the get_signer calls here and in the preflight
+        indexer = ChainIndexer(node_client,
+                               [self.cli_cfg.core_address.as_int(), self.cli_cfg.executor_address.as_int()],
+                               index_db) if index_db else None
+        if indexer is not None:
+            runtime.on_shutdown(indexer.close)
+
+        # a shared tracker (sweep_coordinator.py) outlives this account, its owner settles the outcome
+        shared = tracker is not None
+        if shared:
+            rpc = tracker.rpc
+        else:
+            rpc = JsonRpcBatch(self.cli_cfg.node, runtime.session(), verbose=self.cli_cfg.verbose)
+            tracker = ReceiptTracker(rpc, verbose=self.cli_cfg.verbose)
+        outcome = WithdrawOutcome()
+
+        async def wait_for_receipts():
+            if shared:
+                return outcome
+            await outcome.settle()
+            if outcome.transactions:
+                print(f"\n=== Confirmed {len(outcome.transactions)} transaction(s) ===")
+            for tx_hash, status in outcome.transactions.items():
+                print(f"{'❌' if status.startswith('failed') else '✅'} {tx_hash}: {status}")
+            await rpc.close()
+            return outcome
         
         trading_account = self.cli_cfg.trading_account[0]
         
@@ -70,22 +104,30 @@ class WithdrawClient(CustomCLIClient):
                                     trading_account, self.cli_cfg.gas_fee_steps)
         
         print("=== Checking signer binding ===")
+        bind_sent, bind_receipt = False, None
         try:
-            signer_result = await contract_client.get_signer(trading_account)
-            current_signer: ContractAddress = signer_result.data if hasattr(signer_result, 'data') else signer_result
-            print(current_signer)
-            
-            if current_signer.as_int() == 0 or current_signer is None:
-                print("Signer not bound, binding to signer...")
-                with suppress_stdout():
-                    bind_result = await self.handle_request(self.exchange_client, 'bind_to_signer', [], 
-                                                          trading_account, self.cli_cfg.gas_fee_steps)
-                print(f"Bind result: {bind_result}")
+            indexed_signer = indexer.signer_of(trading_account) if indexer is not None else None
+            if indexed_signer is not None:
+                print(f"Signer already bound (local index): {indexed_signer}")
             else:
-                print(f"Signer already bound: {current_signer}")
+                signer_result = await contract_client.get_signer(trading_account)
+                current_signer: ContractAddress = signer_result.data if hasattr(signer_result, 'data') \
+                    else signer_result
+                print(current_signer)
+            
+                if current_signer.as_int() == 0 or current_signer is None:
+                    print("Signer not bound, binding to signer...")
+                    with suppress_stdout():
+                        bind_result = await self.handle_request(self.exchange_client, 'bind_to_signer', [], 
+                                                              trading_account, self.cli_cfg.gas_fee_steps)
+                    print(f"Bind result: {bind_result}")
+                    bind_sent, bind_receipt = True, outcome.track(tracker, bind_result)
+                else:
+                    print(f"Signer already bound: {current_signer}")
         except Exception as e:
             print(f"Error checking signer: {e}")
             logging.exception(e)
+            outcome.fail('signer', e)
         
         print("=== Authorization ===")
         with suppress_stdout():
@@ -94,6 +136,7 @@ class WithdrawClient(CustomCLIClient):
         print(f"Authorization: {auth_result}")
         
         print("=== Updating gas price ===")
+        gas_result = None
         try:
             with suppress_stdout():
                 gas_result = await self.handle_request(self.exchange_client, 'query_gas_price', [], 
@@ -117,63 +160,109 @@ class WithdrawClient(CustomCLIClient):
                 locked_float = float(locked) if locked != '0' else 0.0
                 print(f"{token_symbol}: {balance_float:.6f} (locked: {locked_float:.6f})")
             
-            print("\n=== Starting funds withdrawal ===")
-            
+            if bind_receipt is not None:
+                # get_signer at latest stays 0 until the bind is accepted, the preflight would reject everything
+                print("Waiting for signer binding to be accepted...")
+                try:
+                    print(f"Bind accepted: {await bind_receipt}")
+                except Exception as e:
+                    print(f"Bind failed: {e}")
+                    logging.exception(e)
+                    outcome.fail('signer', e)
+
+            print("\n=== Preflight ===")
+            plans = []
             for token_symbol, (balance_raw, locked_raw) in balances.items():
-                balance_float = float(balance_raw) if balance_raw != '0' else 0.0
-                
-                if balance_float > 0:
-                    if token_symbol == 'STRK':
-                        if balance_float > 1.0:
-                            withdraw_amount = balance_float - 1.0
-                            print(f"Withdrawing {token_symbol}: {withdraw_amount:.6f} (leaving 1 STRK)")
-                        else:
-                            print(f"Insufficient {token_symbol} for withdrawal (less than 1 token)")
-                            continue
+                balance = Decimal(str(balance_raw))
+                if balance <= 0:
+                    print(f"No funds to withdraw: {token_symbol}")
+                    outcome.skip(token_symbol, 'no funds')
+                else:
+                    plans.append(PlannedWithdrawal(trading_account, token_symbol, balance))
+
+            # 1 STRK stays on balance, gas is taken from the STRK withdrawal, which goes last
+            planner = FeePlanner(self._erc_to_decimals, reserves={'STRK': Decimal(1)})
+            preflight = WithdrawPreflight(rpc, self.cli_cfg.core_address.as_int(),
+                                          {token.symbol: token.address.as_int() for token in self.cli_cfg.tokens},
+                                          self._erc_to_decimals, self.cli_cfg.gas_fee_steps,
+                                          self.cli_cfg.gas_multiplier, planner, indexer)
+            try:
+                # a bind whose hash could not be tracked is assumed to land before the withdrawals
+                await preflight.run(plans, {trading_account: {t: Decimal(str(b)) for t, (b, _) in balances.items()}},
+                                    assume_bound=[trading_account] if bind_sent and bind_receipt is None else (),
+                                    gas_price=gas_price_of(gas_result))
+                for plan in plans:
+                    print(plan)
+            except Exception as e:
+                print(f"Preflight failed, submitting without checks: {e}")
+                logging.exception(e)
+                for plan in plans:
+                    plan.net_amount = plan.amount - planner.reserves.get(plan.token, Decimal(0))
+                    if plan.net_amount <= 0:
+                        plan.reject('nothing above reserve')
+
+            print("\n=== Starting funds withdrawal ===")
+
+            for i, plan in enumerate(plans):
+                token_symbol = plan.token
+                if runtime.stopping:
+                    print("Shutdown requested, not submitting further withdrawals")
+                    for rest in plans[i:]:
+                        if rest.ok:
+                            outcome.fail(rest.token, 'shutdown requested')
+                    break
+                if not plan.ok:
+                    print(f"Skipping {token_symbol}: {plan.reason}")
+                    outcome.skip(token_symbol, plan.reason)
+                    continue
+                withdraw_amount_str = f"{plan.net_amount:f}"
+                if token_symbol == 'STRK':
+                    print(f"Withdrawing {token_symbol}: {withdraw_amount_str} (leaving 1 STRK)")
+                else:
+                    print(f"Withdrawing all {token_symbol}: {withdraw_amount_str}")
+
+                try:
+                    with suppress_stdout():
+                        result = await self.handle_request(
+                            self.exchange_client, 
+                            'withdraw', 
+                            [token_symbol, withdraw_amount_str], 
+                            trading_account, 
+                            self.cli_cfg.gas_fee_steps
+                        )
+                    print(f"Withdrawal result for {token_symbol}: {result}")
+                    if result:
+                        outcome.submit(token_symbol, withdraw_amount_str)
                     else:
-                        withdraw_amount = balance_float
-                        print(f"Withdrawing all {token_symbol}: {withdraw_amount:.6f}")
+                        outcome.fail(token_symbol, f'withdraw returned {result}')
                     
-                    try:
-                        withdraw_amount_str = str(withdraw_amount)
-                        
-                        with suppress_stdout():
-                            result = await self.handle_request(
-                                self.exchange_client, 
-                                'withdraw', 
-                                [token_symbol, withdraw_amount_str], 
-                                trading_account, 
-                                self.cli_cfg.gas_fee_steps
-                            )
-                        print(f"Withdrawal result for {token_symbol}: {result}")
-                        
-                        await asyncio.sleep(2)
-                        
-                    except Exception as e:
-                        print(f"Error withdrawing {token_symbol}: {e}")
-                        logging.exception(e)
-                else:
-                    print(f"No funds to withdraw: {token_symbol}")
+                    await asyncio.sleep(2)
+                    
+                except Exception as e:
+                    print(f"Error withdrawing {token_symbol}: {e}")
+                    logging.exception(e)
+                    outcome.fail(token_symbol, e)
         
         else:
             print("Failed to get balance information")
+            outcome.fail('user_info', f'no balance information: {user_info}')
         
         print("\n=== Funds withdrawal completed ===")
         
-        # Wait 3 seconds and close connections
-        print("Waiting 3 seconds before closing connections...")
-        await asyncio.sleep(3)
+        return await wait_for_receipts()
+
 
 async def main():
     parser = argparse.ArgumentParser(prog='WithdrawScript', description='Automatic withdrawal of all funds from LayerAkira')
     parser.add_argument('--toml_config_file', default='config.toml')
+    parser.add_argument('--index_db', help='chain_indexer.py database used to skip per-account signer reads')
     args = parser.parse_args()
     
     logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO, filename='logs.txt')
     
     cli_client = WithdrawClient(args.toml_config_file)
-    await cli_client.withdraw_all_funds(AppDomain(cli_client.cli_cfg.chain_id.value))
+    await cli_client.withdraw_all_funds(AppDomain(cli_client.cli_cfg.chain_id.value), args.index_db)
 
 
 if __name__ == "__main__":
-    asyncio.get_event_loop().run_until_complete(main()) 
\ No newline at end of file
+    run(main)
\ No newline at end of file